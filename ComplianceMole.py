@@ -1,14 +1,28 @@
 import pandas as pd
+import numpy as np
 import openpyxl
-import matplotlib.pyplot as plt
-from openpyxl.drawing.image import Image
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-from openpyxl.chart import PieChart, Reference
-from tkinter import Tk, filedialog, simpledialog, Label, Entry, Button
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side, NamedStyle, DEFAULT_FONT
 from datetime import datetime
+import argparse
+import glob
+import json
+import time
 import os
 import io
+import numbers
+import hashlib
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from copy import copy
+from functools import lru_cache
+from contextlib import contextmanager, redirect_stdout
+from types import SimpleNamespace
 
 # -------------------- Constants --------------------
 CANONICAL_REPORT_HEADERS = [
@@ -26,6 +40,15 @@ CSV_HEADER_ALIASES = {
     "flow_rate_l_min|flowrate_l_min|flow_rate|flowrate|flow": "FLOW RATE"
 }
 
+# Optional sample columns that pick a scoped limit rule (see RANGE_SCOPE_COLS); only
+# matched when the ranges are scoped, kept after the report headers and never reported
+# as missing
+SCOPE_HEADER_ALIASES = {
+    "site|site_id|plant|facility": "SITE",
+    "line|line_id|process_line|production_line": "LINE",
+    "sample_date|sampled_at|sampled_on|collection_date|date|timestamp": "SAMPLE DATE"
+}
+
 RANGE_COL_MAP = {
     "chemical": "Chemical",
     "concentration_ppm_min": "Concentration_ppm_Min",
@@ -40,36 +63,286 @@ RANGE_COL_MAP = {
     "flow_rate_l_min_max": "Flow_Rate_L_min_Max"
 }
 
+# Optional ranges columns that make every row a scoped, versioned rule: limits for a
+# chemical at one site and/or line (blank = any) over an effective-date interval
+RANGE_SCOPE_COLS = {
+    "site|site_id|plant|facility": "Site",
+    "line|line_id|process_line|production_line": "Line",
+    "effective_from|valid_from|effective_date|start_date": "Effective_From",
+    "effective_to|valid_to|expires|end_date": "Effective_To",
+    "version|rule|rule_id|revision": "Version"
+}
+
+# Ranges workbook: $COMPLIANCEMOLE_RANGES, else CompliantRanges.xlsx next to this script
+RANGES_PATH = os.environ.get("COMPLIANCEMOLE_RANGES") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "CompliantRanges.xlsx")
+# Compiled copies of ranges workbooks, rebuilt whenever the workbook changes
+RANGES_CACHE_DIR = os.environ.get("COMPLIANCEMOLE_CACHE") or os.path.join(
+    os.path.expanduser("~"), ".cache", "compliancemole")
+# Rendered pass/fail pie PNGs for --chart image, keyed by (pass, fail)
+CHART_CACHE_DIR = os.path.join(RANGES_CACHE_DIR, "charts")
+
+# (sample column, ranges column prefix) for the five min/max checks, in report order
+COMPLIANCE_CHECKS = [
+    ("CONCENTRATION", "Concentration_ppm"),
+    ("pH LEVEL", "pH_Level"),
+    ("TEMPERATURE", "Temperature_C"),
+    ("PRESSURE", "Pressure_kPa"),
+    ("FLOW RATE", "Flow_Rate_L_min")
+]
+MEASUREMENT_COLS = [col for col, _ in COMPLIANCE_CHECKS]
+
+# Rows per chunk when streaming a CSV through the compliance check
+CHUNK_SIZE = 100_000
+# Excel's hard limit on rows per worksheet (title and header rows included)
+EXCEL_MAX_ROWS = 1_048_576
+# Per-chemical partition files used by --out-of-core
+OUT_OF_CORE_PARTITIONS = 64
+# The Summary fast paths (_merge, _copy_style, shared borders in _outline, the style cache
+# of _copy_to_write_only) use openpyxl internals verified against 3.1.x only; any other
+# release takes the slower public API
+OPENPYXL_FAST_PATH = openpyxl.__version__.split(".")[:2] == ["3", "1"]
+
+ReportOptions = namedtuple(
+    "ReportOptions", ["chunksize", "write_only", "formats", "chart", "shard_rows", "shard_mode", "trend_window",
+                      "trend_history", "score_formula"],
+    defaults=[CHUNK_SIZE, True, ("xlsx",), "image", None, "sheets", 0, None, False])
+ReportOptions.__doc__ = """How reports are written; one value shared by every entry point (see report_options).
+
+chunksize: rows per streamed CSV chunk; write_only: stream the workbook to disk
+instead of building it in memory; formats: OUTPUT_FORMATS to write; chart: one of
+CHART_MODES; shard_rows/shard_mode: where Sample Data continues past a full sheet
+(see format_excel); trend_window/trend_history: rolling trends, off at 0 (see
+TrendTracker); score_formula: the Summary score as a live SUMPRODUCT formula.
+"""
+
+# Report names start with REPORT_PREFIX; the row, summary and trends files of each
+# non-xlsx format add one of RESULT_SUFFIXES to the report's stem
+REPORT_PREFIX = "Chemical_Compliance_Report_"
+RESULT_SUFFIXES = ("_results", "_summary", "_trends")
+
 # -------------------- Utilities --------------------
+_NORM_REPLACEMENTS = [
+    (o, new) for old, new in {
+        "°c|(c)|c°": "celsius", " c ": " celsius ",
+        "kpa": "kpa", "l/min|l per min|l per minute": "l_min", "ph": "ph"
+    }.items() for o in old.split("|") if o != new
+]
+
+@lru_cache(maxsize=4096)
 def _norm(s: str) -> str:
     """Normalize column name for matching."""
     s = (s or "").strip().lower()
-    replacements = {
-        "°c|(c)|c°": "celsius", " c ": " celsius ",
-        "kpa": "kpa", "l/min|l per min|l per minute": "l_min", "ph": "ph"
-    }
-    for old, new in replacements.items():
-        for o in old.split("|"):
-            s = s.replace(o, new)
+    for old, new in _NORM_REPLACEMENTS:
+        s = s.replace(old, new)
     return "".join(c if c.isalnum() or c == "_" else "_" for c in s).strip("_")
 
+# -------------------- Instrumentation --------------------
+def _current_rss():
+    """Resident set size in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+class RunReport:
+    """Exclusive wall time, rows and peak RSS per pipeline stage for one run.
+
+    Stages nest (reading happens inside the Sample Data writer's pull loop), so time is
+    charged to the innermost open stage only, per thread; with the async pipeline the
+    stages overlap and their seconds can add up to more than the wall time. RSS is
+    sampled on a background thread and credited to whichever stages are running.
+    """
+
+    def __init__(self, sample_interval=0.01):
+        self.sample_interval = sample_interval
+        self.started = datetime.now()
+        self.stages = {}  # name -> {"seconds", "rows", "calls", "peak_rss"}
+        self.peak_rss = None
+        self.info = {}  # free-form run details (inputs, outputs, ...)
+        self._stacks = {}  # thread id -> open [stage name, seconds counted from] pairs
+        self._lock = threading.Lock()
+        self._thread_id = threading.get_ident
+        self._done = None
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._t0
+        self._done.set()
+        self._sampler.join()
+        return False
+
+    def _sample(self):
+        while not self._done.wait(self.sample_interval):
+            rss = _current_rss()
+            if rss is None:
+                return
+            self.peak_rss = max(self.peak_rss or 0, rss)
+            with self._lock:
+                for stack in self._stacks.values():
+                    if stack:
+                        entry = self.stages[stack[-1][0]]
+                        entry["peak_rss"] = max(entry["peak_rss"] or 0, rss)
+
+    def _charge(self, stack, now):
+        name, since = stack[-1]
+        self.stages[name]["seconds"] += now - since
+        stack[-1][1] = now
+
+    def enter(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            stack = self._stacks.setdefault(self._thread_id(), [])
+            if stack:
+                self._charge(stack, now)
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0, "calls": 0, "peak_rss": None})
+            entry["calls"] += 1
+            stack.append([name, now])
+
+    def exit(self, rows=0):
+        now = time.perf_counter()
+        with self._lock:
+            stack = self._stacks[self._thread_id()]
+            self._charge(stack, now)
+            name, _ = stack.pop()
+            self.stages[name]["rows"] += rows
+            if stack:
+                stack[-1][1] = now
+
+    def merge(self, stages):
+        """Fold in stage entries from another report's to_dict() (e.g. a batch worker)."""
+        for item in stages:
+            entry = self.stages.setdefault(item["stage"], {"seconds": 0.0, "rows": 0, "calls": 0, "peak_rss": None})
+            entry["seconds"] += item["seconds"]
+            entry["rows"] += item["rows"]
+            entry["calls"] += item["calls"]
+            if item["peak_rss_mb"] is not None:
+                entry["peak_rss"] = max(entry["peak_rss"] or 0, int(item["peak_rss_mb"] * 2**20))
+
+    def stage_list(self):
+        return [{
+            "stage": name,
+            "seconds": round(e["seconds"], 4),
+            "rows": e["rows"],
+            "rows_per_second": round(e["rows"] / e["seconds"]) if e["rows"] and e["seconds"] else None,
+            "calls": e["calls"],
+            "peak_rss_mb": round(e["peak_rss"] / 2**20, 1) if e["peak_rss"] else None,
+        } for name, e in self.stages.items()]
+
+    def to_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": round(getattr(self, "seconds", time.perf_counter() - self._t0), 4),
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1) if self.peak_rss else None,
+            "python": sys.version.split()[0],
+            **self.info,
+            "stages": self.stage_list(),
+        }
+
+    def save(self, path):
+        with open(path, "w") as fh:
+            json.dump(self.to_dict(), fh, indent=2, default=str)
+
+_active_report = None  # RunReport receiving stage() timings, if any
+
+@contextmanager
+def stage(name, rows=0):
+    """Attribute the enclosed work to ``name`` in the active RunReport (a no-op without one).
+
+    Yields a namespace whose ``rows`` may be set inside the block.
+    """
+    counter = SimpleNamespace(rows=rows)
+    report = _active_report
+    if report is None:
+        yield counter
+        return
+    report.enter(name)
+    try:
+        yield counter
+    finally:
+        report.exit(counter.rows)
+
+@contextmanager
+def instrumented(report):
+    """Make ``report`` the active RunReport for the duration of the block."""
+    global _active_report
+    if report is None:
+        yield None
+        return
+    previous, _active_report = _active_report, report
+    try:
+        with report:
+            yield report
+    finally:
+        _active_report = previous
+
+PROFILE_KINDS = ("cpu", "memory")
+
+@contextmanager
+def profiling(kinds, out_dir="."):
+    """cProfile ("cpu") and/or tracemalloc ("memory") around the block, dumped into ``out_dir``."""
+    profiler = None
+    if "cpu" in kinds:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    if "memory" in kinds:
+        import tracemalloc
+        tracemalloc.start(25)
+    try:
+        yield
+    finally:
+        if kinds:
+            os.makedirs(out_dir, exist_ok=True)
+        if profiler is not None:
+            profiler.disable()
+            path = os.path.join(out_dir, "profile.pstats")
+            profiler.dump_stats(path)
+            print(f"CPU profile saved at: {path} (view with python -m pstats)")
+        if "memory" in kinds:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            path = os.path.join(out_dir, "memory_profile.txt")
+            with open(path, "w") as fh:
+                fh.write(f"traced peak: {peak / 2**20:.1f} MiB, still allocated: {current / 2**20:.1f} MiB\n\n")
+                for stat in snapshot.statistics("lineno")[:50]:
+                    fh.write(f"{stat}\n")
+            snapshot.dump(os.path.join(out_dir, "memory_profile.tracemalloc"))
+            print(f"Memory profile saved at: {path}")
+
+
 # -------------------- File Handling --------------------
-from tkinter import Tk, Label, Entry, Button
-from datetime import datetime
+# tkinter is imported inside the dialog helpers so headless runs never load it
+def make_user_info(first, middle, last, company, date=None):
+    """Build the analyst/company info dict used for report naming and the Summary sheet."""
+    info = {
+        "FirstName": first, "MiddleName": middle, "LastName": last,
+        "FirstIntl": first[:1], "MidIntl": middle[:1], "LastIntl": last[:1],
+        "CompanyName": company,
+        "DateToday": date or datetime.today().strftime("%Y%m%d"),
+    }
+    info["CompletedBy"] = f"{first} {middle} {last}".strip()
+    return info
 
 def get_user_info():
+    from tkinter import Tk, Label, Entry, Button
     info = {}
 
     def on_submit():
-        info["FirstName"] = entry_first.get()
-        info["MiddleName"] = entry_middle.get()
-        info["LastName"] = entry_last.get()
-        info["FirstIntl"] = entry_first.get()[:1]
-        info["MidIntl"] = entry_middle.get()[:1]
-        info["LastIntl"] = entry_last.get()[:1]
-        info["CompanyName"] = entry_company.get()
-        info["DateToday"] = datetime.today().strftime("%Y%m%d")
-        info["CompletedBy"] = f"{info['FirstName']} {info['MiddleName']} {info['LastName']}".strip()
+        info.update(make_user_info(entry_first.get(), entry_middle.get(), entry_last.get(), entry_company.get()))
 
         root.quit()
         root.destroy()
@@ -121,32 +394,116 @@ def get_user_info():
 
 def select_file(title="Select CSV File", filetypes=[("CSV Files", "*.csv")]):
     """Select file via dialog."""
+    from tkinter import Tk, filedialog
     Tk().withdraw()
     return filedialog.askopenfilename(title=title, filetypes=filetypes)
 
+def report_file_name(user_info, version=None):
+    """Report file name, with a _v{version} suffix for repeat runs."""
+    initials = f"{user_info['FirstIntl']}{user_info['MidIntl']}{user_info['LastIntl']}"
+    suffix = f"_v{version}" if version else ""
+    return f"{REPORT_PREFIX}{user_info['CompanyName']}_{user_info['DateToday']}_{initials}{suffix}.xlsx"
+
 def get_save_path(user_info):
     """Generate and verify save path."""
-    initials = f"{user_info['FirstIntl']}{user_info['MidIntl']}{user_info['LastIntl']}"
-    base_name = f"Chemical_Compliance_Report_{user_info['CompanyName']}_{user_info['DateToday']}_{initials}.xlsx"
+    from tkinter import Tk, filedialog, simpledialog
     Tk().withdraw()
-    save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", initialfile=base_name)
+    save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", initialfile=report_file_name(user_info))
     if save_path and os.path.exists(save_path):
         version = simpledialog.askstring("Version", "Enter version number:") or "2"
-        base_name = f"Chemical_Compliance_Report_{user_info['CompanyName']}_{user_info['DateToday']}_{initials}_v{version}.xlsx"
-        save_path = os.path.join(os.path.dirname(save_path), base_name)
+        save_path = os.path.join(os.path.dirname(save_path), report_file_name(user_info, version))
+    return save_path
+
+def next_save_path(output_dir, user_info, taken=(), formats=("xlsx",)):
+    """Non-interactive get_save_path: first free name, versioned from _v2 up.
+
+    ``taken`` holds paths already promised to other files in the same batch. A name
+    is free only if none of the files written for ``formats`` exist yet.
+    """
+    def in_use(path):
+        return path in taken or any(os.path.exists(p) for group in output_paths(path, formats).values() for p in group)
+
+    save_path = os.path.join(output_dir, report_file_name(user_info))
+    version = 2
+    while in_use(save_path):
+        save_path = os.path.join(output_dir, report_file_name(user_info, version))
+        version += 1
     return save_path
 
+def is_generated_csv(path):
+    """True for a CSV this tool wrote next to a report (see output_paths)."""
+    name = os.path.basename(path)
+    return name.startswith(REPORT_PREFIX) and name.endswith(tuple(f"{s}.csv" for s in RESULT_SUFFIXES))
+
+def collect_csv_paths(inputs):
+    """Expand input files and directories into a sorted list of CSV paths.
+
+    Directories skip the CSV results of earlier runs, so an output directory can be
+    rerun as input; files named explicitly are always kept.
+    """
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(p for p in sorted(glob.glob(os.path.join(path, "*.csv"))) if not is_generated_csv(p))
+        else:
+            paths.append(path)
+    return paths
+
 # -------------------- Data Processing --------------------
-def standardize_csv_headers(df: pd.DataFrame) -> pd.DataFrame:
-    """Standardize CSV headers and ensure required columns."""
-    rename_map = {}
-    used_targets = set()
-    for col in df.columns:
-        for aliases, target in CSV_HEADER_ALIASES.items():
-            if _norm(col) in aliases.split("|") and target not in used_targets:
-                rename_map[col] = target
-                used_targets.add(target)
-    
+# Normalized alias -> canonical header, compiled once from CSV_HEADER_ALIASES, and with
+# SCOPE_HEADER_ALIASES for scoped ranges (built in reverse so an earlier group wins if an
+# alias is ever listed twice)
+HEADER_ALIAS_INDEX = {
+    alias: target for aliases, target in reversed(list(CSV_HEADER_ALIASES.items()))
+    for alias in aliases.split("|")
+}
+SCOPED_HEADER_ALIAS_INDEX = {
+    alias: target for aliases, target in reversed(list({**CSV_HEADER_ALIASES, **SCOPE_HEADER_ALIASES}.items()))
+    for alias in aliases.split("|")
+}
+
+HeaderResolution = namedtuple("HeaderResolution", ["rename_map", "unmatched", "ambiguous", "missing"])
+HeaderResolution.__doc__ = """Outcome of matching a CSV header row to the canonical report headers.
+
+rename_map: source column -> canonical header; unmatched: source columns that
+match no alias (kept under their own names); ambiguous: canonical header ->
+every source column that matched it, the first of which is used; missing:
+canonical headers no column supplied (filled with NA).
+"""
+
+@lru_cache(maxsize=256)
+def _resolve_header_row(columns: tuple, scoped: bool) -> HeaderResolution:
+    index = SCOPED_HEADER_ALIAS_INDEX if scoped else HEADER_ALIAS_INDEX
+    matches = {}
+    unmatched = []
+    for col in columns:
+        target = index.get(_norm(col))
+        if target is None:
+            unmatched.append(col)
+        else:
+            matches.setdefault(target, []).append(col)
+    return HeaderResolution(
+        rename_map={cols[0]: target for target, cols in matches.items()},
+        unmatched=unmatched,
+        ambiguous={target: cols for target, cols in matches.items() if len(cols) > 1},
+        missing=[h for h in dict.fromkeys(CSV_HEADER_ALIASES.values()) if h not in matches and h not in columns],
+    )
+
+def resolve_headers(columns, scoped=False) -> HeaderResolution:
+    """Resolve a whole header row in one pass; repeated schemas are served from a cache.
+
+    With ``scoped`` (the ranges have RANGE_SCOPE_COLS) the SCOPE_HEADER_ALIASES are
+    matched too. The result is shared between callers with the same header row, so
+    treat it as read-only.
+    """
+    return _resolve_header_row(tuple(columns), scoped)
+
+def resolve_csv_headers(columns, scoped=False) -> dict:
+    """Map source CSV column names to canonical report headers."""
+    return dict(resolve_headers(columns, scoped).rename_map)
+
+def apply_csv_headers(df: pd.DataFrame, rename_map: dict) -> pd.DataFrame:
+    """Rename to canonical headers, add missing columns and coerce measurements."""
     df = df.rename(columns=rename_map)
     for col in CANONICAL_REPORT_HEADERS:
         if col not in df.columns:
@@ -154,14 +511,65 @@ def standardize_csv_headers(df: pd.DataFrame) -> pd.DataFrame:
     df = df[[c for c in CANONICAL_REPORT_HEADERS if c in df.columns] + 
             [c for c in df.columns if c not in CANONICAL_REPORT_HEADERS]]
     
-    for col in ["CONCENTRATION", "pH LEVEL", "TEMPERATURE", "PRESSURE", "FLOW RATE"]:
-        if col in df.columns:
+    for col in MEASUREMENT_COLS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col].dtype):
             df[col] = pd.to_numeric(df[col], errors="coerce")
     return df
 
-def load_ranges():
-    """Load and standardize ranges from Excel."""
-    ranges_path = r"C:\Users\mkb00\PROJECTS\PythonProjects\ComplianceMole\CompliantRanges.xlsx"
+def standardize_csv_headers(df: pd.DataFrame, scoped=False) -> pd.DataFrame:
+    """Standardize CSV headers and ensure required columns."""
+    return apply_csv_headers(df, resolve_csv_headers(df.columns, scoped))
+
+def _as_float(values) -> np.ndarray:
+    """Float array for range checks; anything that is not a real number becomes NaN."""
+    values = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return values.to_numpy(dtype="float64", na_value=np.nan)
+    return np.array([float(v) if isinstance(v, numbers.Real) and not pd.isna(v) else np.nan
+                     for v in values], dtype="float64")
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Store a standardized frame compactly: categorical CHEMICAL, narrower measurement dtypes.
+
+    Measurements only narrow (float64 -> float32, int64 -> smallest int) when every
+    value survives the round trip exactly, so checks and written output are unchanged.
+    """
+    if "CHEMICAL" in df.columns:
+        df["CHEMICAL"] = df["CHEMICAL"].astype("category")
+    for col in MEASUREMENT_COLS:
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy()
+        if values.dtype == np.float64:
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow, values, equal_nan=True):
+                df[col] = narrow
+        elif values.dtype == np.int64:
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    return df
+
+def widen_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of a compact frame with plain dtypes (categoricals decoded, float64/int64 numbers).
+
+    For the Parquet writer, where per-chunk categories and narrowed dtypes would
+    not line up across row groups.
+    """
+    out = {}
+    for name, col in df.items():
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            target = col.cat.categories.dtype
+            if target.kind in "iub" and col.isna().any():
+                target = np.float64  # as read_csv types a number column with gaps
+            col = col.astype(target)
+        elif col.dtype.kind == "f" and col.dtype != np.float64:
+            col = col.astype(np.float64)
+        elif col.dtype.kind == "i" and col.dtype != np.int64:
+            col = col.astype(np.int64)
+        out[name] = col
+    return pd.DataFrame(out, index=df.index)
+
+def _read_ranges_workbook(ranges_path):
+    """Parse and standardize the ranges workbook (slow; see load_ranges for the cached path)."""
     rng = pd.read_excel(ranges_path)
     norm_to_original = {_norm(col): col for col in rng.columns}
     
@@ -177,191 +585,998 @@ def load_ranges():
     missing = [v for k, v in RANGE_COL_MAP.items() if k != "chemical" and v not in rng.columns]
     if missing:
         raise KeyError(f"Missing columns in CompliantRanges.xlsx: {', '.join(missing)}")
+
+    scope = {}
+    for aliases, target in RANGE_SCOPE_COLS.items():
+        found = next((norm_to_original[a] for a in aliases.split("|") if a in norm_to_original), None)
+        if found is not None and found != chem_col:
+            scope[found] = target
+    rng = rng.rename(columns=scope)
     
     return rng.set_index(chem_col)
 
-def check_compliance(df: pd.DataFrame, ranges_df: pd.DataFrame) -> pd.DataFrame:
-    """Check compliance against ranges."""
-    req_cols = ["CHEMICAL", "CONCENTRATION", "pH LEVEL", "TEMPERATURE", "PRESSURE", "FLOW RATE"]
-    if not all(c in df.columns for c in req_cols):
+RangeLimits = namedtuple("RangeLimits", ["chemicals", "ambiguous", "bounds", "rules"])
+RangeLimits.__doc__ = """Ranges compiled for vectorized lookup.
+
+chemicals: unique chemical Index (first listing wins), whose positions are the
+chemical codes; ambiguous: bool array, True where a chemical is listed more than
+once; bounds: contiguous float array of shape (chemicals + 1, checks, 2) holding
+(min, max) per check in COMPLIANCE_CHECKS order, NaN where a limit is missing or
+not numeric. The extra last row is all NaN (and ambiguous False) so code -1,
+an unknown chemical, indexes it directly.
+
+rules: None, or for a scoped ranges table (RANGE_SCOPE_COLS) the rule index built
+by _rule_index. Then bounds and ambiguous have one row per ranges row (rule), a
+rule is ambiguous when its interval overlaps another rule of the same scope, and
+limit_codes resolves samples to rules.
+"""
+
+# Day numbers for effective dates: open-ended intervals run from DAY_MIN to DAY_MAX
+DAY_MIN, DAY_MAX = 0, 2 ** 31
+_DAY_OFFSET = 2 ** 30  # days since 1970 shifted to stay positive
+
+def _day_numbers(values, missing: int) -> np.ndarray:
+    """Whole days of each date (DAY_MIN < day < DAY_MAX); ``missing`` where it is blank or not a date."""
+    # Sample dates repeat heavily; parse each distinct value once
+    row_codes, uniques = pd.factorize(pd.Series(values))
+    dates = pd.to_datetime(pd.Series(uniques, dtype=object), errors="coerce", format="mixed")
+    if getattr(dates.dt, "tz", None) is not None:
+        dates = dates.dt.tz_localize(None)
+    days = dates.to_numpy("datetime64[ns]").astype("datetime64[D]").astype(np.int64)
+    days = np.where(dates.isna().to_numpy(), missing, np.clip(days + _DAY_OFFSET, DAY_MIN + 1, DAY_MAX - 1))
+    return np.append(days, missing).take(row_codes)
+
+def _scope_text(value) -> str:
+    """Scope value as matched and labelled: blank for NA, no ".0" on whole numbers read as float."""
+    if pd.isna(value):
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def _scope_key(chemical, site="", line="") -> str:
+    return f"{chemical}\x1f{site}\x1f{line}"
+
+def _rule_index(ranges_df: pd.DataFrame) -> dict:
+    """Hashed scope keys plus, per key, rule intervals sorted by start date, for searchsorted lookups.
+
+    Kept to plain NumPy/pandas values (a dict, not a class) so it pickles into the
+    ranges cache either way this file is loaded.
+    """
+    def scope_values(col):
+        if col not in ranges_df.columns:
+            return np.full(len(ranges_df), "", dtype=object)
+        return np.array([_scope_text(v) for v in ranges_df[col].astype(object)], dtype=object)
+
+    chem = np.array([str(c) for c in ranges_df.index], dtype=object)
+    site, line = scope_values("Site"), scope_values("Line")
+    start = _day_numbers(ranges_df["Effective_From"], DAY_MIN) if "Effective_From" in ranges_df else (
+        np.full(len(ranges_df), DAY_MIN))
+    end = _day_numbers(ranges_df["Effective_To"], DAY_MAX - 1) + 1 if "Effective_To" in ranges_df else (
+        np.full(len(ranges_df), DAY_MAX))  # Effective_To is the last day the rule applies
+    key_codes, keys = pd.factorize(pd.Series([_scope_key(*k) for k in zip(chem, site, line)], dtype=object))
+
+    order = np.lexsort((start, key_codes))
+    sorted_key, sorted_start, sorted_end = key_codes[order], start[order], end[order]
+    overlap = (sorted_key[1:] == sorted_key[:-1]) & (sorted_start[1:] < sorted_end[:-1])
+    ambiguous = np.zeros(len(ranges_df), dtype=bool)
+    ambiguous[order[1:][overlap]] = True
+    ambiguous[order[:-1][overlap]] = True
+
+    # A chemical's representative rule (for per-chemical callers such as trends): its
+    # latest chemical-wide rule, else its latest rule of any scope
+    rep = pd.DataFrame({"chem": chem, "general": (site == "") & (line == ""), "start": start,
+                        "rule": np.arange(len(ranges_df))}).sort_values(["general", "start"], kind="stable")
+    current = rep.groupby("chem", sort=False)["rule"].last()
+
+    versions = ranges_df["Version"].astype(object) if "Version" in ranges_df else pd.Series([None] * len(ranges_df))
+    froms = ranges_df["Effective_From"] if "Effective_From" in ranges_df else pd.Series([None] * len(ranges_df))
+    labels = []
+    for c, st, ln, version, since, day in zip(chem, site, line, versions, froms, start):
+        label = f"{c} @ {st or '*'}/{ln or '*'}"
+        if _scope_text(version):
+            label += f" v{_scope_text(version)}"
+        elif day != DAY_MIN:
+            label += f" from {pd.Timestamp(since):%Y-%m-%d}"
+        labels.append(label)
+    label_codes, label_names = pd.factorize(pd.Series(labels + [""], dtype=object))
+
+    return {
+        "keys": pd.Index(keys, dtype=object),
+        "from": sorted_key.astype(np.int64) * (DAY_MAX * 2) + sorted_start,  # (key, start) as one sortable int
+        "key": sorted_key, "end": sorted_end, "rule": order,
+        "ambiguous": ambiguous,
+        "current": current,
+        "label_codes": label_codes, "label_names": pd.Index(label_names, dtype=object),
+    }
+
+def is_scoped(ranges_df: pd.DataFrame) -> bool:
+    """Whether a ranges table has any RANGE_SCOPE_COLS, making its rows scoped rules."""
+    return any(col in ranges_df.columns for col in RANGE_SCOPE_COLS.values())
+
+def range_limits(ranges_df: pd.DataFrame) -> RangeLimits:
+    """Compile a ranges table into a per-chemical (or, when scoped, per-rule) bounds matrix."""
+    if is_scoped(ranges_df):
+        rules = _rule_index(ranges_df)
+        bounds = np.full((len(ranges_df) + 1, len(COMPLIANCE_CHECKS), 2), np.nan)
+        for j, (_, prefix) in enumerate(COMPLIANCE_CHECKS):
+            bounds[:-1, j, 0] = _as_float(ranges_df[f"{prefix}_Min"])
+            bounds[:-1, j, 1] = _as_float(ranges_df[f"{prefix}_Max"])
+        chemicals = pd.Index(rules["current"].index, dtype=object)
+        return RangeLimits(chemicals=chemicals, ambiguous=np.append(rules.pop("ambiguous"), False), bounds=bounds,
+                           rules=rules)
+
+    first = ~ranges_df.index.duplicated(keep="first")
+    limit_rows = ranges_df[first]
+    bounds = np.full((len(limit_rows) + 1, len(COMPLIANCE_CHECKS), 2), np.nan)
+    for j, (_, prefix) in enumerate(COMPLIANCE_CHECKS):
+        bounds[:-1, j, 0] = _as_float(limit_rows[f"{prefix}_Min"])
+        bounds[:-1, j, 1] = _as_float(limit_rows[f"{prefix}_Max"])
+    return RangeLimits(
+        chemicals=limit_rows.index,
+        ambiguous=np.append(ranges_df.index.duplicated(keep=False)[first], False),
+        bounds=bounds,
+        rules=None,
+    )
+
+RANGES_CACHE_VERSION = 2  # bump when _read_ranges_workbook or range_limits change their results
+_ranges_memo = {}  # path -> ((mtime_ns, size), (ranges_df, limits)): the latest load of each workbook
+
+def _load_compiled_ranges(ranges_path, use_cache=True):
+    """Ranges frame and compiled limits, via the on-disk cache when it is still valid.
+
+    Cache entries are keyed by the workbook's absolute path and validated against its
+    mtime and size; if those moved but the SHA-256 of the contents did not (a copy or a
+    touch), the entry is reused. Anything else rebuilds it from the workbook.
+    """
+    path = os.path.abspath(ranges_path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if use_cache and path in _ranges_memo and _ranges_memo[path][0] == version:
+        return _ranges_memo[path][1]
+
+    cache_file = os.path.join(RANGES_CACHE_DIR, hashlib.sha1(path.encode()).hexdigest() + ".pkl")
+    entry = None
+    if use_cache and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as fh:
+                entry = pickle.load(fh)
+        except Exception:
+            entry = None  # unreadable cache is simply rebuilt
+
+    if entry is not None and (entry.get("version") != RANGES_CACHE_VERSION
+                              or not all(f in entry for f in RangeLimits._fields)):
+        entry = None  # written by an older version of the compiler or layout of RangeLimits
+
+    digest = None
+    if entry is None or (entry["mtime_ns"], entry["size"]) != (stat.st_mtime_ns, stat.st_size):
+        with open(path, "rb") as fh:
+            digest = hashlib.sha256(fh.read()).hexdigest()
+        if entry is None or entry["sha256"] != digest:
+            ranges_df = _read_ranges_workbook(path)
+            limits = range_limits(ranges_df)
+            # Plain pandas/NumPy values only, so the cache loads whether this file runs as
+            # a script or is imported as a module
+            entry = {"version": RANGES_CACHE_VERSION, "frame": ranges_df,
+                     **{f: getattr(limits, f) for f in RangeLimits._fields}}
+        entry.update(path=path, mtime_ns=stat.st_mtime_ns, size=stat.st_size, sha256=digest)
+        if use_cache:
+            try:
+                os.makedirs(RANGES_CACHE_DIR, exist_ok=True)
+                tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+                with open(tmp_file, "wb") as fh:
+                    pickle.dump(entry, fh, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, cache_file)
+            except OSError:
+                pass  # the cache is an optimization; a read-only location just means no cache
+
+    result = (entry["frame"], RangeLimits(*(entry[f] for f in RangeLimits._fields)))
+    if use_cache:
+        _ranges_memo[path] = (version, result)  # replaces any older version of the workbook
+    return result
+
+def load_ranges(ranges_path=RANGES_PATH, use_cache=True):
+    """Load and standardize ranges from Excel."""
+    return _load_compiled_ranges(ranges_path, use_cache)[0]
+
+def load_range_limits(ranges_path=RANGES_PATH, use_cache=True) -> RangeLimits:
+    """Compiled min/max arrays for the ranges workbook, ready for vectorized lookup."""
+    return _load_compiled_ranges(ranges_path, use_cache)[1]
+
+def chemical_codes(chemicals, limits: RangeLimits) -> np.ndarray:
+    """Row of ``limits`` for each chemical; -1 where it is missing or not in the ranges table.
+
+    With scoped rules this is each chemical's representative rule; samples are
+    resolved with limit_codes.
+    """
+    # Hash each row once (factorize), then look up only the distinct names
+    row_codes, uniques = pd.factorize(pd.Series(chemicals))
+    if limits.rules is None:
+        rows = limits.chemicals.get_indexer(uniques)
+    else:
+        rows = limits.rules["current"].reindex([str(u) for u in uniques]).fillna(-1).to_numpy(np.int64)
+    return np.append(rows, -1).take(row_codes)
+
+def limit_codes(df: pd.DataFrame, limits: RangeLimits) -> np.ndarray:
+    """Row of ``limits`` that decides each sample (-1 = none applies).
+
+    Without scoped rules this is the chemical's row. With them, the most specific rule
+    in effect on the sample's SAMPLE DATE wins: chemical + site + line, then chemical
+    + site, chemical + line, chemical alone. Undated samples take the rule in effect
+    last. Each level is one hashed key lookup over the distinct combinations present
+    and one binary search over the sorted rule intervals.
+    """
+    rules = limits.rules
+    if rules is None:
+        return chemical_codes(df["CHEMICAL"], limits)
+
+    def factorized(col, text=_scope_text):
+        if col not in df.columns:
+            return np.full(len(df), -1), np.array([], dtype=object)
+        row_codes, uniques = pd.factorize(pd.Series(df[col]))
+        return row_codes, np.array([text(u) for u in uniques], dtype=object)
+
+    chem_codes, chem_names = factorized("CHEMICAL", lambda u: str(u).strip())
+    site_codes, site_names = factorized("SITE")
+    line_codes, line_names = factorized("LINE")
+    days = (_day_numbers(df["SAMPLE DATE"], DAY_MAX - 1) if "SAMPLE DATE" in df.columns
+            else np.full(len(df), DAY_MAX - 1))
+    n_sites, n_lines = len(site_names) + 1, len(line_names) + 1
+    site_names, line_names = np.append("", site_names), np.append("", line_names)  # code -1 -> any
+
+    codes = np.full(len(df), -1, dtype=np.int64)
+    for use_site, use_line in ((True, True), (True, False), (False, True), (False, False)):
+        todo = np.flatnonzero((codes < 0) & (chem_codes >= 0))
+        if not len(todo):
+            break
+        site = site_codes[todo] + 1 if use_site else np.zeros(len(todo), dtype=np.int64)
+        line = line_codes[todo] + 1 if use_line else np.zeros(len(todo), dtype=np.int64)
+        combo = (chem_codes[todo] * n_sites + site) * n_lines + line
+        combo_codes, combos = pd.factorize(combo)
+        names = [_scope_key(chem_names[c // (n_sites * n_lines)], site_names[c // n_lines % n_sites],
+                            line_names[c % n_lines]) for c in combos]
+        key = rules["keys"].get_indexer(names).take(combo_codes)
+        pos = np.searchsorted(rules["from"], key * (DAY_MAX * 2) + days[todo], side="right") - 1
+        pos = np.clip(pos, 0, None)
+        found = (key >= 0) & (rules["key"].take(pos) == key) & (days[todo] < rules["end"].take(pos))
+        codes[todo[found]] = rules["rule"].take(pos[found])
+    return codes
+
+def rule_labels(codes: np.ndarray, limits: RangeLimits) -> pd.Categorical:
+    """RULE column: which scoped rule (and version) decided each row; blank where none applied."""
+    rules = limits.rules
+    return pd.Categorical.from_codes(rules["label_codes"].take(codes), categories=rules["label_names"])
+
+REQUIRED_CHECK_COLS = ["CHEMICAL", "CONCENTRATION", "pH LEVEL", "TEMPERATURE", "PRESSURE", "FLOW RATE"]
+
+def compliance_bits(df: pd.DataFrame, limits: RangeLimits, codes: np.ndarray) -> np.ndarray:
+    """One bit per failed check (COMPLIANCE_CHECKS order) for each row of ``df``.
+
+    A missing or non-numeric value/limit fails its check, same as the comparison raising
+    or returning False per row. A chemical listed more than once fails every check.
+    """
+    fail_bits = np.zeros(len(df), dtype=np.int64)
+    for bit, (col, _) in enumerate(COMPLIANCE_CHECKS):
+        # One column of the bounds matrix at a time keeps temporaries at one value per row
+        lo = limits.bounds[:, bit, 0].take(codes)
+        hi = limits.bounds[:, bit, 1].take(codes)
+        val = _as_float(df[col])
+        with np.errstate(invalid="ignore"):
+            failed = ~((lo <= val) & (val <= hi))
+        fail_bits |= failed.astype(np.int64) << bit
+    fail_bits[limits.ambiguous.take(codes)] = (1 << len(COMPLIANCE_CHECKS)) - 1
+    return fail_bits
+
+STATUS_CATEGORIES = ["COMPLIANT", "NON-COMPLIANT", "UNKNOWN CHEMICAL", "UNKNOWN"]
+
+def describe_compliance(codes: np.ndarray, fail_bits: np.ndarray, ranges_df: pd.DataFrame, limits: RangeLimits):
+    """STATUS and COMMENT categoricals for rows given as (limits row, failed-check bits).
+
+    Each row only holds small integer codes; a COMMENT text is built once per distinct
+    (chemical, failed checks) pair present, and read out when the row is written.
+    """
+    # -1 keys are unknown chemicals; the rest pack (limits row, failed-check bits)
+    keys = np.where(codes >= 0, codes * (1 << len(COMPLIANCE_CHECKS)) + fail_bits, -1)
+    uniq_keys, inverse = np.unique(keys, return_inverse=True)
+    texts, text_codes, state_codes = {}, [], []
+    for key in uniq_keys:
+        if key < 0:
+            state, text = "UNKNOWN CHEMICAL", "No compliance data found."
+        else:
+            code, bits = divmod(int(key), 1 << len(COMPLIANCE_CHECKS))
+            row_limits = ranges_df.loc[limits.chemicals[code]] if limits.rules is None else ranges_df.iloc[code]
+            issues = [f"{col} not within acceptable range: {row_limits[f'{prefix}_Min']} - {row_limits[f'{prefix}_Max']}."
+                      for bit, (col, prefix) in enumerate(COMPLIANCE_CHECKS) if bits >> bit & 1]
+            state = "NON-COMPLIANT" if issues else "COMPLIANT"
+            text = " ".join(issues) if issues else "Within Acceptable Ranges"
+        state_codes.append(STATUS_CATEGORIES.index(state))
+        text_codes.append(texts.setdefault(text, len(texts)))
+    inverse = inverse.reshape(-1)  # flat on every NumPy version
+    status = pd.Categorical.from_codes(np.array(state_codes, dtype=np.int8)[inverse], categories=STATUS_CATEGORIES)
+    comment = pd.Categorical.from_codes(np.array(text_codes, dtype=np.int32)[inverse], categories=list(texts))
+    return status, comment
+
+def check_compliance(df: pd.DataFrame, ranges_df: pd.DataFrame, limits: RangeLimits = None) -> pd.DataFrame:
+    """Check compliance against ranges.
+
+    ``limits`` is ``range_limits(ranges_df)``; pass it in when checking many chunks
+    against the same table.
+    """
+    if not all(c in df.columns for c in REQUIRED_CHECK_COLS):
         df["STATUS"] = "UNKNOWN"
         df["COMMENT"] = "Required columns missing in source CSV."
         return df
+    if limits is None:
+        limits = range_limits(ranges_df)
+
+    # Join every sample to its limits row once (-1 = chemical missing from the ranges table,
+    # which indexes the NaN padding appended to each limits column)
+    codes = limit_codes(df, limits)
+    df["STATUS"], df["COMMENT"] = describe_compliance(codes, compliance_bits(df, limits, codes), ranges_df, limits)
+    if limits.rules is not None:
+        df["RULE"] = rule_labels(codes, limits)
+    return df
 
-    for idx, row in df.iterrows():
-        chem = row["CHEMICAL"]
-        if pd.isna(chem) or chem not in ranges_df.index:
-            df.at[idx, "STATUS"] = "UNKNOWN CHEMICAL"
-            df.at[idx, "COMMENT"] = "No compliance data found."
-            continue
 
-        limits = ranges_df.loc[chem]
-        issues = []
-        checks = [
-            ("CONCENTRATION", "Concentration_ppm", row["CONCENTRATION"]),
-            ("pH LEVEL", "pH_Level", row["pH LEVEL"]),
-            ("TEMPERATURE", "Temperature_C", row["TEMPERATURE"]),
-            ("PRESSURE", "Pressure_kPa", row["PRESSURE"]),
-            ("FLOW RATE", "Flow_Rate_L_min", row["FLOW RATE"])
-        ]
-        
-        for col, prefix, val in checks:
-            try:
-                if not (limits[f"{prefix}_Min"] <= val <= limits[f"{prefix}_Max"]):
-                    issues.append(f"{col} not within acceptable range: {limits[f'{prefix}_Min']} - {limits[f'{prefix}_Max']}.")
-            except (TypeError, ValueError):
-                issues.append(f"{col} not within acceptable range: {limits[f'{prefix}_Min']} - {limits[f'{prefix}_Max']}.")
-        
-        df.at[idx, "STATUS"] = "NON-COMPLIANT" if issues else "COMPLIANT"
-        df.at[idx, "COMMENT"] = " ".join(issues) if issues else "Within Acceptable Ranges"
-    
-    return df
+def _read_csv_chunks(csv_path, chunksize: int):
+    """pd.read_csv in chunks, with the parsing charged to the read_csv stage."""
+    with pd.read_csv(csv_path, chunksize=chunksize) as reader:
+        while True:
+            with stage("read_csv") as st:
+                chunk = next(reader, None)
+                st.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+def _standardizer(scoped=False, compact=False):
+    """Standardize one file's chunks: headers resolved on the first chunk, applied to all.
+
+    Canonical columns the file lacks come back as NA (see apply_csv_headers);
+    ``compact`` also narrows the dtypes (see compact_frame).
+    """
+    rename_map = None
+
+    def standardize(chunk):
+        nonlocal rename_map
+        with stage("standardize_headers", len(chunk)):
+            if rename_map is None:
+                rename_map = resolve_csv_headers(chunk.columns, scoped)  # once per file
+            chunk = apply_csv_headers(chunk, rename_map)
+            return compact_frame(chunk) if compact else chunk
+    return standardize
+
+def iter_standardized_chunks(csv_path, chunksize: int = CHUNK_SIZE, scoped=False, compact=False):
+    """_read_csv_chunks with canonical headers (see _standardizer)."""
+    standardize = _standardizer(scoped, compact)
+    for chunk in _read_csv_chunks(csv_path, chunksize):
+        yield standardize(chunk)
+
+def iter_compliance_chunks(csv_path, ranges_df: pd.DataFrame, chunksize: int = CHUNK_SIZE,
+                           limits: RangeLimits = None):
+    """Read, standardize and check a CSV chunk by chunk, yielding checked frames."""
+    if limits is None:
+        limits = range_limits(ranges_df)
+    for chunk in iter_standardized_chunks(csv_path, chunksize, limits.rules is not None, compact=True):
+        with stage("check_compliance", len(chunk)):
+            chunk = check_compliance(chunk, ranges_df, limits)
+        yield chunk
+
+
+# -------------------- Aggregation --------------------
+_SUMMARY_AGG = {
+    "TOTAL": "sum", "PASS": "sum", "NON-COMPLIANT": "sum",
+    **{f"{col} {stat}": agg for col in MEASUREMENT_COLS
+       for stat, agg in (("COUNT", "sum"), ("SUM", "sum"), ("MIN", "min"), ("MAX", "max"))}
+}
 
+_CHUNK_AGG = {"TOTAL": ["sum"], "PASS": ["sum"], "NON-COMPLIANT": ["sum"],
+              **{col: ["count", "sum", "min", "max"] for col in MEASUREMENT_COLS}}
+
+# Pass-rate bands for the Summary sheet's PRIORITY column
+PRIORITY_HIGH_BELOW = 0.45
+PRIORITY_LOW_ABOVE = 0.55
+
+# Summary RANGES columns, per measurement in report order
+RANGE_STAT_COLS = [f"{col} {stat}" for col in MEASUREMENT_COLS for stat in ("MIN", "MAX", "MEAN")]
+
+class ComplianceSummary:
+    """Mergeable per-chemical counts and measurement stats behind the Summary sheet."""
+
+    def __init__(self):
+        self.rows = 0
+        self.pass_count = 0
+        self.fail_count = 0
+        self.table = pd.DataFrame(columns=list(_SUMMARY_AGG))
+
+    def update(self, df: pd.DataFrame) -> "ComplianceSummary":
+        """Fold a checked frame (or chunk) into the running totals."""
+        passed = (df["STATUS"] == "COMPLIANT").to_numpy()
+        failed = (df["STATUS"] == "NON-COMPLIANT").to_numpy()
+        self.rows += len(df)
+        self.pass_count += int(passed.sum())
+        self.fail_count += int(failed.sum())
+
+        # Every per-chemical statistic in a single grouped aggregation
+        # float64 so narrowed (float32) chunks aggregate exactly like full-width ones
+        values = df[MEASUREMENT_COLS].apply(pd.to_numeric, errors="coerce").astype("float64")
+        values["TOTAL"], values["PASS"], values["NON-COMPLIANT"] = 1, passed.astype(int), failed.astype(int)
+        part = values.groupby(df["CHEMICAL"].to_numpy(), sort=False).agg(_CHUNK_AGG)
+        part.columns = [col if stat == "sum" and col in _SUMMARY_AGG else f"{col} {stat.upper()}"
+                        for col, stat in part.columns]
+        self._fold(part)
+        return self
+
+    def merge(self, other: "ComplianceSummary") -> "ComplianceSummary":
+        """Combine with a summary built from another chunk, partition or file."""
+        self.rows += other.rows
+        self.pass_count += other.pass_count
+        self.fail_count += other.fail_count
+        self._fold(other.table)
+        return self
+
+    def to_dict(self) -> dict:
+        """JSON-ready partials; from_dicts restores a summary that merges like the original."""
+        table = self.table[list(_SUMMARY_AGG)].astype("float64")
+        return {
+            "rows": self.rows, "pass": self.pass_count, "fail": self.fail_count,
+            "columns": list(_SUMMARY_AGG),
+            "chemicals": table.index.tolist(),
+            "values": [[None if np.isnan(v) else v for v in row] for row in table.to_numpy().tolist()],
+        }
+
+    @classmethod
+    def from_dicts(cls, items) -> "ComplianceSummary":
+        """One summary from any number of to_dict() partials, merged in a single grouped aggregation."""
+        summary = cls()
+        chemicals, values = [], []
+        for data in items:
+            if data["columns"] != list(_SUMMARY_AGG):
+                raise ValueError("summary partials have different columns")
+            summary.rows += data["rows"]
+            summary.pass_count += data["pass"]
+            summary.fail_count += data["fail"]
+            chemicals += data["chemicals"]
+            values += data["values"]
+        if chemicals:
+            table = pd.DataFrame(np.array(values, dtype="float64"), index=chemicals, columns=list(_SUMMARY_AGG))
+            summary.table = table.groupby(level=0, sort=False).agg(_SUMMARY_AGG)
+        return summary
+
+    def _fold(self, part: pd.DataFrame):
+        if self.table.empty:
+            self.table = part[list(_SUMMARY_AGG)]
+        elif not part.empty:
+            combined = pd.concat([self.table, part[list(_SUMMARY_AGG)]])
+            self.table = combined.groupby(level=0, sort=False).agg(_SUMMARY_AGG)
+
+    @property
+    def chemicals(self) -> list:
+        return sorted(self.table.index)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Per-chemical TOTAL/PASS/FAIL/SCORE/PRIORITY plus MIN/MAX/MEAN per measurement.
+
+        Rows are sorted by chemical; this is everything the Summary sheet shows.
+        """
+        t = self.table.loc[self.chemicals]
+        total, passed = t["TOTAL"].astype(int), t["PASS"].astype(int)
+        score = (passed / total.where(total > 0)).fillna(0.0)
+        out = pd.DataFrame({
+            "TOTAL": total, "PASS": passed, "FAIL": total - passed, "SCORE": score,
+            "PRIORITY": np.select([score < PRIORITY_HIGH_BELOW, score > PRIORITY_LOW_ABOVE], ["HIGH", "LOW"], "MEDIUM"),
+        })
+        # Every measurement's MIN/MAX/MEAN as (chemicals, measurements) matrices in one step
+        stat_cols = {stat: [f"{col} {stat}" for col in MEASUREMENT_COLS] for stat in ("COUNT", "SUM", "MIN", "MAX")}
+        m = {stat: t[cols].to_numpy(dtype="float64") for stat, cols in stat_cols.items()}
+        with np.errstate(invalid="ignore", divide="ignore"):
+            m["MEAN"] = m["SUM"] / np.where(m["COUNT"] > 0, m["COUNT"], np.nan)
+        stats = np.stack([m["MIN"], m["MAX"], m["MEAN"]], axis=2).reshape(len(t), len(RANGE_STAT_COLS))
+        return pd.concat([out, pd.DataFrame(stats, index=t.index, columns=RANGE_STAT_COLS)], axis=1)
+
+
+def summarize_compliance(df: pd.DataFrame) -> pd.DataFrame:
+    """Summary-sheet statistics for a checked frame, in one grouped pass (see ComplianceSummary)."""
+    return ComplianceSummary().update(df).to_frame()
+
+
+CHART_MODES = ("native", "image", "none")
+PIE_COLORS = ["#C2CAE8", "#8D9FCD"]
+PIE_IMAGE_VERSION = 1  # bump when the rendered image changes, to retire cached PNGs
+
+@lru_cache(maxsize=256)
+def _pass_fail_png(pass_count, fail_count, cache_dir=None):
+    """PNG bytes of the pass/fail pie, cached in memory and in ``cache_dir`` (default CHART_CACHE_DIR)."""
+    cache_dir = cache_dir or CHART_CACHE_DIR
+    cache_file = os.path.join(cache_dir, f"pie_v{PIE_IMAGE_VERSION}_{pass_count}_{fail_count}.png")
+    try:
+        with open(cache_file, "rb") as fh:
+            return fh.read()
+    except OSError:
+        pass
+
+    # matplotlib is imported here, not at module level, so startup stays fast. Drawing on a
+    # bare Figure with the Agg canvas never touches pyplot or a GUI backend (headless-safe).
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-def add_pass_fail_chart(ws, pass_count, fail_count, cell="M11"): # Build matplotlib pie chart
     dpi = 96  # Match Excel's rendering DPI
     width_in = 3.58
     height_in = 2.01
 
-    fig, ax = plt.subplots(figsize=(width_in, height_in))  # figsize is (width, height)
+    fig = Figure(figsize=(width_in, height_in))  # figsize is (width, height)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     ax.pie([pass_count, fail_count], labels=["Pass", "Fail"], autopct="%1.0f%%",
-        colors=["#C2CAE8", "#8D9FCD"], startangle=90)
+        colors=PIE_COLORS, startangle=90)
     ax.axis("equal")
 
     img_bytes = io.BytesIO()
-    plt.savefig(img_bytes, format="png", dpi=dpi)  # Save at 96 DPI
-    plt.close(fig)
-    img_bytes.seek(0)
+    fig.savefig(img_bytes, format="png", dpi=dpi)  # Save at 96 DPI
+    data = img_bytes.getvalue()
 
-    img = Image(img_bytes)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass  # an unwritable cache only costs a re-render next time
+    return data
+
+def add_pass_fail_chart(ws, pass_count, fail_count, cell="M11", cache_dir=None): # Embed matplotlib pie chart
+    from openpyxl.drawing.image import Image
+
+    if not pass_count and not fail_count:
+        return  # nothing to draw; matplotlib cannot plot an all-zero pie
+    img = Image(io.BytesIO(_pass_fail_png(int(pass_count), int(fail_count), cache_dir)))
     # No need to set .width and .height — Excel will use native pixel size
     img.anchor = cell
     ws.add_image(img)
 
+def add_native_pass_fail_chart(ws, value_cells, label_cells, counts, cell="M11"):
+    """Native Excel pie chart whose series points at the pass/fail cells; nothing is rasterized.
+
+    The cells need not be adjacent (Excel's "(a,b)" union reference). Cached values are
+    included so viewers that don't recalculate formulas still draw the right slices.
+    """
+    from openpyxl.chart import PieChart
+    from openpyxl.chart.data_source import (NumDataSource, NumRef, NumData, NumVal,
+                                            AxDataSource, StrRef, StrData, StrVal)
+    from openpyxl.chart.label import DataLabelList
+    from openpyxl.chart.marker import DataPoint
+    from openpyxl.chart.series import Series
+    from openpyxl.chart.shapes import GraphicalProperties
+    from openpyxl.utils import absolute_coordinate, quote_sheetname
+
+    sheet = quote_sheetname(ws.title)
+    def union(cells):
+        return "(" + ",".join(f"{sheet}!{absolute_coordinate(c)}" for c in cells) + ")"
+
+    labels = [ws[c].value for c in label_cells]
+    series = Series(
+        val=NumDataSource(numRef=NumRef(f=union(value_cells), numCache=NumData(
+            ptCount=len(counts), pt=[NumVal(idx=i, v=int(v)) for i, v in enumerate(counts)]))),
+        cat=AxDataSource(strRef=StrRef(f=union(label_cells), strCache=StrData(
+            ptCount=len(labels), pt=[StrVal(idx=i, v=v) for i, v in enumerate(labels)]))),
+    )
+    series.dPt = [DataPoint(idx=i, spPr=GraphicalProperties(solidFill=color.lstrip("#")))
+                  for i, color in enumerate(PIE_COLORS)]
+    series.dLbls = DataLabelList(showCatName=True, showPercent=True, showVal=False,
+                                 showSerName=False, showLegendKey=False)
+
+    chart = PieChart()
+    chart.series.append(series)
+    chart.legend = None
+    chart.width, chart.height = 9.09, 5.1  # cm; same footprint as the 3.58in x 2.01in image
+    ws.add_chart(chart, cell)
+
+
+# -------------------- Trends --------------------
+TREND_WINDOW = 20  # most recent samples per chemical in the rolling window
+TREND_MIN_SAMPLES = 5  # fewer samples in the window than this are not assessed
+TREND_HEADROOM = 0.1  # moving mean closer to a limit than this fraction of the band is NEAR LIMIT
+TREND_MIN_T = 2.0  # drift slope must be this many standard errors from zero to count as a trend
+TREND_HISTORY_VERSION = 1  # bump when the history file layout changes
+TREND_COLS = ["CHEMICAL", "MEASUREMENT", "SAMPLES", "WINDOW", "MOVING MEAN", "MOVING STD", "HEADROOM",
+              "DRIFT PER SAMPLE", "SAMPLES TO LIMIT", "TREND"]
+TREND_FLAGS = ("VIOLATING", "TRENDING")
+
+def _file_digest(path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class TrendTracker:
+    """Rolling per-chemical window statistics over checked chunks, carried across runs.
+
+    Only the last ``window`` samples of each chemical (in input order) are kept, so
+    every update costs the chunk plus chemicals x window. With ``history_path`` those
+    tails persist between runs, together with digests of the inputs already folded
+    in, so a file that is run again is not counted twice.
+    """
+
+    def __init__(self, limits: RangeLimits, window=TREND_WINDOW, history_path=None):
+        self.limits = limits
+        self.window = window
+        self.history_path = history_path
+        self.tails = pd.DataFrame({col: pd.Series(dtype=dtype)
+                                   for col, dtype in [("CHEMICAL", object)] + [(c, "float64") for c in MEASUREMENT_COLS]})
+        self.samples = pd.Series(dtype="int64")  # chemical -> samples seen, history included
+        self.inputs = []  # digests of the files folded into the history
+        self.replay = False  # the current input is already in the history
+        if history_path and os.path.exists(history_path):
+            with open(history_path, "rb") as fh:
+                history = pickle.load(fh)
+            if history.get("version") == TREND_HISTORY_VERSION:
+                self.tails = history["tails"].groupby("CHEMICAL", sort=False).tail(window)
+                self.samples, self.inputs = history["samples"], history["inputs"]
+
+    def start(self, csv_path) -> "TrendTracker":
+        """Begin an input file; one already in the history is reported, not re-added."""
+        if self.history_path:
+            self._digest = _file_digest(csv_path)
+            self.replay = self._digest in self.inputs
+        return self
+
+    def update(self, df: pd.DataFrame) -> "TrendTracker":
+        """Fold a checked chunk into the per-chemical windows."""
+        if self.replay or df.empty:
+            return self
+        part = df[["CHEMICAL"] + MEASUREMENT_COLS].astype({"CHEMICAL": object, **dict.fromkeys(MEASUREMENT_COLS, "float64")})
+        part = part[part["CHEMICAL"].notna()]
+        self.samples = self.samples.add(part["CHEMICAL"].value_counts(), fill_value=0).astype("int64")
+        tail = part.groupby("CHEMICAL", sort=False).tail(self.window)
+        self.tails = pd.concat([self.tails, tail], ignore_index=True).groupby("CHEMICAL", sort=False).tail(self.window)
+        return self
+
+    def save(self):
+        """Write the windows back to the history file (no-op without one)."""
+        if not self.history_path:
+            return
+        if not self.replay:
+            self.inputs = self.inputs + [self._digest]
+        tmp = self.history_path + ".tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump({"version": TREND_HISTORY_VERSION, "window": self.window, "tails": self.tails,
+                         "samples": self.samples, "inputs": self.inputs}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.history_path)
+
+    def to_frame(self) -> pd.DataFrame:
+        """One row per chemical and measurement (TREND_COLS), sorted by chemical.
+
+        HEADROOM is the moving mean's distance to the nearer limit as a fraction of the
+        band (negative once outside it); DRIFT PER SAMPLE is the least-squares slope over
+        the window, and SAMPLES TO LIMIT projects it onto the limit it is heading for when
+        the slope is significant (TREND_MIN_T).
+        """
+        names = np.array(sorted(self.tails["CHEMICAL"].unique()), dtype=object)
+        # Right-aligned (chemicals, window, measurements) cube, NaN-padded for short histories
+        codes = pd.Index(names).get_indexer(self.tails["CHEMICAL"])
+        grouped = self.tails.groupby("CHEMICAL", sort=False)
+        slots = self.window - grouped["CHEMICAL"].transform("size").to_numpy() + grouped.cumcount().to_numpy()
+        cube = np.full((len(names), self.window, len(MEASUREMENT_COLS)), np.nan)
+        cube[codes, slots] = self.tails[MEASUREMENT_COLS].to_numpy()
+
+        present = ~np.isnan(cube)
+        n = present.sum(axis=1)
+        x = np.arange(self.window, dtype="float64")[None, :, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(cube, axis=1) / n
+            dev = np.where(present, cube - mean[:, None, :], 0.0)
+            std = np.sqrt((dev ** 2).sum(axis=1) / (n - 1))
+            xdev = np.where(present, x - (present * x).sum(axis=1, keepdims=True) / n[:, None, :], 0.0)
+            sxx = (xdev ** 2).sum(axis=1)
+            slope = (xdev * dev).sum(axis=1) / sxx
+            resid = np.where(present, dev - slope[:, None, :] * xdev, 0.0)
+            significant = np.abs(slope) * np.sqrt(sxx) > TREND_MIN_T * np.sqrt((resid ** 2).sum(axis=1) / (n - 2))
+
+            bounds = self.limits.bounds[chemical_codes(names, self.limits)]  # (chemicals, checks, 2)
+            low, high = bounds[..., 0], bounds[..., 1]
+            to_low, to_high = mean - low, high - mean
+            headroom = np.fmin(to_low, to_high) / (high - low)
+            heading_high = to_high < to_low
+            heading = significant & np.where(heading_high, slope > 0, slope < 0)
+            samples_to_limit = np.where(heading, np.where(heading_high, to_high, to_low) / np.abs(slope), np.nan)
+        trend = np.select(
+            [n < TREND_MIN_SAMPLES, np.isnan(headroom), headroom < 0,
+             heading & (samples_to_limit <= self.window), headroom < TREND_HEADROOM],
+            ["TOO FEW SAMPLES", "NO LIMITS", "VIOLATING", "TRENDING", "NEAR LIMIT"], "STABLE")
+
+        checks = len(MEASUREMENT_COLS)
+        return pd.DataFrame({
+            "CHEMICAL": np.repeat(names, checks),
+            "MEASUREMENT": np.tile(MEASUREMENT_COLS, len(names)),
+            "SAMPLES": np.repeat(self.samples.reindex(names, fill_value=0).to_numpy(), checks),
+            "WINDOW": n.ravel(),
+            "MOVING MEAN": mean.ravel(), "MOVING STD": std.ravel(), "HEADROOM": headroom.ravel(),
+            "DRIFT PER SAMPLE": slope.ravel(), "SAMPLES TO LIMIT": samples_to_limit.ravel(),
+            "TREND": trend.ravel(),
+        }, columns=TREND_COLS)
+
+    def flagged(self, trends: pd.DataFrame = None) -> list:
+        """Chemicals with at least one measurement VIOLATING or TRENDING toward a limit."""
+        trends = self.to_frame() if trends is None else trends
+        return sorted(trends.loc[trends["TREND"].isin(TREND_FLAGS), "CHEMICAL"].unique())
 
 # -------------------- Excel Formatting --------------------
-#summary_ws = wb.create_sheet("Sample Data")
-def format_excel(df, save_path, user_info):
-    """Format the Excel output."""
-    # Create workbook with Summary as the first sheet
-    wb = openpyxl.Workbook()
-    summary_ws = wb.active
-    summary_ws.title = "Summary"
-    # Create Sample Data sheet second
-    ws = wb.create_sheet("Sample Data")
-    
-    # Write DataFrame directly to Sample Data sheet using openpyxl
-    from openpyxl.utils.dataframe import dataframe_to_rows
-    for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=True), 1):
-        for c_idx, value in enumerate(row, 1):
-            ws.cell(row=r_idx, column=c_idx).value = value
-    
-    # Save workbook to ensure sheets are created
-    wb.save(save_path)
-    
-    # Debug: Verify sheet names after saving
-    wb = openpyxl.load_workbook(save_path)
-    print("Sheets in workbook:", wb.sheetnames)
-    
-    # Access sheets
-    try:
-        ws = wb["Sample Data"]
-        summary_ws = wb["Summary"]
-    except KeyError as e:
-        raise KeyError(f"Sheet not found: {e}. Available sheets: {wb.sheetnames}")
-    
-    # Styles
-    header_fill = PatternFill(start_color="5C6586", end_color="5C6586", fill_type="solid")
-    subheader_fill = PatternFill(start_color="ADADAD", end_color="ADADAD", fill_type="solid")
-    light_fill = PatternFill(start_color="E8E8E8", end_color="E8E8E8", fill_type="solid")
-    white_fill = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
-    thin = Side(style="thin", color="000000")
-    thick = Side(style="thick", color="000000")
-    double_bottom = Side(border_style="double", color="000000")  # black double line
-    indent_align = Alignment(indent=1)
-    
-    # Auto column width for Sample Data
-    for col in ws.columns:
-        max_length = max(len(str(cell.value or "")) for cell in col) + 2
-        ws.column_dimensions[col[0].column_letter].width = max_length
-
-    # Sample Data: Title row
-    ws.insert_rows(1)
-    ws.merge_cells("A1:I1")
-    ws["A1"] = "SAMPLE DATA"
-    ws["A1"].fill = header_fill
-    ws["A1"].font = Font(name="Aptos Display", bold=True, color="FFFFFF", size=12)
-    ws["A1"].alignment = Alignment(horizontal="left", vertical="center", indent=1)
-    ws.row_dimensions[1].height = 20
-
-    # Sample Data: Header row
-    for col in range(1, 10):
-        cell = ws.cell(2, col)
-        cell.fill = light_fill
-        cell.font = Font(name="Aptos Narrow", bold=True, size=10.5)
-        cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
-        cell.border = Border(bottom=Side(style="double", color="000000"))
-    ws.row_dimensions[2].height = 40
-
-        # Filter
-        # Add AutoFilter to headers in Sample Data
-    max_col = ws.max_column
-    ws.auto_filter.ref = f"A2:{get_column_letter(max_col)}{ws.max_row}"
-
-
-
-    # Sample Data: Data rows
-    for row in range(3, ws.max_row + 1):
-        for col in range(1, 10):
+# Shared style objects; openpyxl stores each distinct style once, so reuse these
+HEADER_FILL = PatternFill(start_color="5C6586", end_color="5C6586", fill_type="solid")
+SUBHEADER_FILL = PatternFill(start_color="ADADAD", end_color="ADADAD", fill_type="solid")
+LIGHT_FILL = PatternFill(start_color="E8E8E8", end_color="E8E8E8", fill_type="solid")
+WHITE_FILL = PatternFill(start_color="FFFFFF", end_color="FFFFFF", fill_type="solid")
+THIN = Side(style="thin", color="000000")
+THICK = Side(style="thick", color="000000")
+DOUBLE_BOTTOM = Side(border_style="double", color="000000")  # black double line
+CENTER = Alignment(horizontal="center", vertical="center")
+SUMMARY_STYLES = {
+    "header": (HEADER_FILL, Font(color="FFFFFF", bold=True), Alignment(horizontal="left", vertical="center")),
+    "subheader": (SUBHEADER_FILL, Font(color="000000", bold=True), CENTER),
+    "light": (LIGHT_FILL, Font(color="000000", bold=True), Alignment(horizontal="left", vertical="center")),
+    "white": (WHITE_FILL, Font(color="000000"), Alignment(horizontal="right", vertical="center"))
+}
+SAMPLE_DATA_COLS = 9  # Styled Sample Data columns A:I (the canonical report headers)
+LINK_FONT = Font(color="0563C1", underline="single")
+SHARD_MODES = ("sheets", "workbooks")
+
+def _excel_text(value) -> str:
+    """Text of a value as it reads back from a saved workbook; sizes the Sample Data columns."""
+    if isinstance(value, (bool, np.bool_)):
+        return str(bool(value)) if value else ""
+    if isinstance(value, numbers.Real):
+        if not np.isfinite(value):
+            return ""  # NaN/inf are written as empty cells
+        text = "%.16g" % value  # openpyxl's number format
+        value = float(text) if any(c in text for c in ".eE") else int(text)
+    return str(value or "")
+
+def _sample_data_style(wb, kind, col, last_row=False):
+    """Named style for a Sample Data cell, with the sheet's outline border baked in."""
+    edge = "left" if col == 1 else "right" if col == SAMPLE_DATA_COLS else "inner"
+    name = f"Sample Data {kind} {edge}{' bottom' if last_row else ''}"
+    if name in wb.named_styles:
+        return name
+
+    if kind == "title":
+        font, fill, sides = copy(DEFAULT_FONT), PatternFill(), {"top": THICK}
+        align = Alignment()
+        if col == 1:
+            font, fill = Font(name="Aptos Display", bold=True, color="FFFFFF", size=12), HEADER_FILL
+            align = Alignment(horizontal="left", vertical="center", indent=1)
+    elif kind == "header":
+        font, fill, sides = Font(name="Aptos Narrow", bold=True, size=10.5), LIGHT_FILL, {"bottom": DOUBLE_BOTTOM}
+        align = Alignment(horizontal="center", vertical="center", wrap_text=True)
+    else:
+        font, fill = Font(name="Aptos Narrow", size=10.5), WHITE_FILL
+        sides = {"top": THIN, "bottom": THIN, "left": THIN, "right": THIN}
+        align = Alignment(horizontal="left", vertical="center", indent=1) if col == SAMPLE_DATA_COLS else CENTER
+    if col == 1: sides["left"] = THICK
+    if col == SAMPLE_DATA_COLS: sides["right"] = THICK
+    if last_row: sides["bottom"] = THICK
+
+    wb.add_named_style(NamedStyle(name=name, font=font, fill=fill, border=Border(**sides), alignment=align))
+    return name
+
+def _styled_row(ws, values, styles):
+    """Row of values for ws.append; the first len(styles) cells get those named styles."""
+    values = list(values) + [None] * (len(styles) - len(values))
+    row = []
+    for col, value in enumerate(values):
+        if col < len(styles):
+            cell = WriteOnlyCell(ws, value)
+            cell.style = styles[col]
+            value = cell
+        row.append(value)
+    return row
+
+class SampleDataShards:
+    """Opens the Sample Data shards after the first: more sheets in the report, or workbooks beside it.
+
+    Called with a part number (2, 3, ...) it returns that part's worksheet. In
+    "workbooks" mode each part is a write-only ``<report>_part<N>.xlsx`` that is saved
+    as soon as the next one opens (``close`` saves the last). ``parts`` lists
+    (sheet title, workbook file name or None) for every part, the first included.
+    """
+
+    def __init__(self, ws, save_path, mode="sheets"):
+        self.wb, self.save_path, self.mode = ws.parent, save_path, mode
+        self.parts = [(ws.title, None)]
+        self._open = None  # (workbook, path) of the shard workbook being written
+
+    def __call__(self, part):
+        title = f"{self.parts[0][0]} {part}"
+        if self.mode == "sheets":
+            self.parts.append((title, None))
+            return self.wb.create_sheet(title)
+        self.close()
+        stem, ext = os.path.splitext(self.save_path)
+        path = f"{stem}_part{part}{ext}"
+        wb = openpyxl.Workbook(write_only=True)
+        self._open = (wb, path)
+        self.parts.append((title, os.path.basename(path)))
+        return wb.create_sheet(title)
+
+    def close(self):
+        if self._open is not None:
+            wb, path = self._open
+            wb.save(path)
+            print(f"Sample Data shard saved at: {path}")
+            self._open = None
+
+def write_sample_data(ws, data, shard_rows=None, new_shard=None) -> ComplianceSummary:
+    """Write the Sample Data sheet in one pass and return the summary of its rows.
+
+    ``data`` is a checked frame or an iterable of checked chunks. Every row is appended
+    once with its final named style, so the same code fills normal and write-only
+    worksheets. Write-only sheets emit column widths before any rows, so there they are
+    sized from the first chunks instead of the whole file.
+
+    A sheet holds at most ``shard_rows`` data rows (default: as many as Excel allows);
+    the rest continue on the worksheets ``new_shard(part)`` returns (default: new sheets
+    "Sample Data 2", "Sample Data 3", ... in the same workbook; see SampleDataShards),
+    each with its own title row, header row and autofilter.
+    """
+    shard_rows = shard_rows or EXCEL_MAX_ROWS - 2
+    if new_shard is None:
+        new_shard = lambda part: ws.parent.create_sheet(f"{ws.title} {part}")
+    summary = ComplianceSummary()
+    header, widths = [], []
+
+    def batches():
+        # Yields (rows, is_last_batch), one chunk behind so the final row is known
+        pending = None
+        for chunk in ([data] if isinstance(data, pd.DataFrame) else data):
+            if not header:
+                header.extend(chunk.columns)
+                widths.extend(len(_excel_text(h)) for h in header)
+            with stage("summarize", len(chunk)):
+                summary.update(chunk)
+            rows = list(dataframe_to_rows(chunk, index=False, header=False))
+            for i, column in enumerate(zip(*rows)):
+                widths[i] = max(widths[i], max(len(_excel_text(v)) for v in set(column)))
+            if pending is not None:
+                yield pending, False
+            pending = rows
+        yield pending or [], True
+
+    def set_widths(sheet):
+        for col, width in enumerate(widths, 1):
+            sheet.column_dimensions[get_column_letter(col)].width = width + 2
+
+    def start_sheet(sheet, title, no_data=False):
+        """Title and header rows; returns the (body, bottom) row styles of the sheet's workbook."""
+        wb = sheet.parent
+        set_widths(sheet)
+        # Title row (merged A1:I1; registered directly so the styled edge cells are kept)
+        sheet.row_dimensions[1].height = 20
+        sheet.append(_styled_row(sheet, [title], [_sample_data_style(wb, "title", c) for c in range(1, SAMPLE_DATA_COLS + 1)]))
+        sheet.merged_cells.add(f"A1:{get_column_letter(SAMPLE_DATA_COLS)}1")
+
+        # Header row
+        sheet.row_dimensions[2].height = 40
+        sheet.append(_styled_row(sheet, header, [_sample_data_style(wb, "header", c, no_data) for c in range(1, SAMPLE_DATA_COLS + 1)]))
+        return ([_sample_data_style(wb, "data", c) for c in range(1, SAMPLE_DATA_COLS + 1)],
+                [_sample_data_style(wb, "data", c, True) for c in range(1, SAMPLE_DATA_COLS + 1)])
+
+    def finish_sheet(sheet, last_row):
+        sheet.auto_filter.ref = f"A2:{get_column_letter(max(len(header), SAMPLE_DATA_COLS))}{last_row}"
+
+    row_batches = batches()
+    rows, is_last = next(row_batches)
+    if not header:
+        header.extend(CANONICAL_REPORT_HEADERS)
+        widths.extend(len(h) for h in header)
+    body, bottom = start_sheet(ws, "SAMPLE DATA", no_data=is_last and not rows)
+    sheets = [ws]
+
+    # Data rows; row heights are set just before each row is written and dropped after,
+    # so a write-only sheet never holds one dimension object per row
+    row_idx = 2
+    while True:
+        for i, values in enumerate(rows):
+            if row_idx - 2 == shard_rows:
+                # Current sheet is full: close it and continue on the next shard
+                finish_sheet(ws, row_idx)
+                ws = new_shard(len(sheets) + 1)
+                sheets.append(ws)
+                body, bottom = start_sheet(ws, f"SAMPLE DATA (PART {len(sheets)})")
+                row_idx = 2
+            row_idx += 1
+            last = (is_last and i == len(rows) - 1) or row_idx - 2 == shard_rows
+            ws.row_dimensions[row_idx].height = 15
+            ws.append(_styled_row(ws, values, bottom if last else body))
+            if ws.parent.write_only:
+                del ws.row_dimensions[row_idx]
+        if is_last:
+            break
+        rows, is_last = next(row_batches)
+
+    finish_sheet(ws, row_idx)
+    for sheet in sheets:
+        if not sheet.parent.write_only:
+            set_widths(sheet)  # now sized from every row
+    return summary
+
+
+def _outline(ws, cell_range, top=None, bottom=None, left=None, right=None):
+    """Set the given sides on the outer edge of a range, keeping each cell's other sides."""
+    min_col, min_row, max_col, max_row = range_boundaries(cell_range)
+    # Only edge cells change, so visit the perimeter rather than the whole area
+    edge = {(row, col) for row in (min_row, max_row) for col in range(min_col, max_col + 1)}
+    edge.update((row, col) for col in (min_col, max_col) for row in range(min_row, max_row + 1))
+    # Cells sharing a border and edge position end up sharing the new border; build each once
+    merged = {}
+    for row, col in sorted(edge):
+        sides = {"top": top if row == min_row else None, "bottom": bottom if row == max_row else None,
+                 "left": left if col == min_col else None, "right": right if col == max_col else None}
+        sides = {k: v for k, v in sides.items() if v is not None}
+        if sides:
             cell = ws.cell(row, col)
-            cell.font = Font(name="Aptos Narrow", size=10.5)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.fill = white_fill
-            cell.border = Border(top=thin, bottom=thin, left=thin, right=thin)
-        ws[f"I{row}"].alignment = Alignment(horizontal="left", vertical="center", indent=1)
-        ws.row_dimensions[row].height = 15
-
-    # Outline borders for Sample Data
-    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=9):
-        for cell in row:
-            borders = {k: cell.border.__dict__[k] for k in ("left", "right", "top", "bottom")}
-            if cell.row == 1: borders["top"] = thick
-            if cell.row == ws.max_row: borders["bottom"] = thick
-            if cell.column == 1: borders["left"] = thick
-            if cell.column == 9: borders["right"] = thick
-            cell.border = Border(**borders)
-
-    # Summary Sheet
-    styles = {
-        "header": (header_fill, Font(color="FFFFFF", bold=True), Alignment(horizontal="left", vertical="center")),
-        "subheader": (subheader_fill, Font(color="000000", bold=True), Alignment(horizontal="center", vertical="center")),
-        "light": (light_fill, Font(color="000000", bold=True), Alignment(horizontal="left", vertical="center")),
-        "white": (white_fill, Font(color="000000"), Alignment(horizontal="right", vertical="center"))
-    }
+            if not OPENPYXL_FAST_PATH:
+                b = cell.border
+                cell.border = Border(**{"left": b.left, "right": b.right, "top": b.top, "bottom": b.bottom, **sides})
+                continue
+            key = (cell._style.borderId if cell._style is not None else 0, tuple(sides))
+            if key in merged and cell._style is not None:
+                cell._style.borderId = merged[key]
+                continue
+            b = cell.border
+            cell.border = Border(**{"left": b.left, "right": b.right, "top": b.top, "bottom": b.bottom, **sides})
+            merged[key] = cell._style.borderId
+
+def _merge(ws, min_row, min_col, max_row, max_col):
+    """ws.merge_cells for a range known not to overlap any other.
+
+    openpyxl checks every new merge against all existing ones, which turns the
+    per-chemical rows of a large Summary quadratic; this skips that scan
+    (see OPENPYXL_FAST_PATH).
+    """
+    if not OPENPYXL_FAST_PATH:
+        ws.merge_cells(start_row=min_row, start_column=min_col, end_row=max_row, end_column=max_col)
+        return
+    from openpyxl.worksheet.merge import MergedCellRange
 
-    # Fill empty cells in A1:Q(last_row+2) with white
-    chemicals = sorted(df["CHEMICAL"].unique())
-    last_row = 11 + len(chemicals) + 1 + 2 + len(chemicals) + 3  # Chemicals table + ranges table + spacing
-    for row in range(1, last_row + 3):
-        for col in range(1, 18):  # A to Q
-            cell = summary_ws.cell(row, col)
-            if not cell.value and not cell.fill.fgColor.rgb:
-                cell.fill = white_fill
+    mcr = MergedCellRange(ws, f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}")
+    ws.merged_cells.ranges.add(mcr)
+    ws._clean_merge_range(mcr)
+
+def _copy_style(src, dst):
+    """Give cell ``dst`` the style of ``src``, sharing its registered style ids where possible."""
+    if OPENPYXL_FAST_PATH:
+        dst._style = copy(src._style)
+    else:
+        dst.font, dst.fill, dst.border = copy(src.font), copy(src.fill), copy(src.border)
+        dst.alignment, dst.protection, dst.number_format = copy(src.alignment), copy(src.protection), src.number_format
+
+def write_summary_sheet(summary_ws, summary: ComplianceSummary, user_info, *, chart="image", shards=(),
+                        score_formula=False):
+    """Fill the Summary sheet from aggregated results.
+
+    ``chart`` is one of CHART_MODES: a native Excel pie bound to the totals row, the
+    matplotlib image, or no chart. ``shards`` lists (sheet title, workbook file or None,
+    rows) per Sample Data part; when there is more than one, a table of links follows
+    the ranges. The total score is written as a precomputed value, or with
+    ``score_formula`` as one SUMPRODUCT over the score and sample columns.
+    """
+    styles = SUMMARY_STYLES
+    stats = summary.to_frame()
+    chemicals = list(stats.index)
 
     # Merge header and set title
     summary_ws.merge_cells("B1:Q1")
     summary_ws["B1"] = "COMPLIANCE ANALYSIS REPORT"
-    for fill, font, align in [styles["header"]]:
-        summary_ws["B1"].fill, summary_ws["B1"].font, summary_ws["B1"].alignment = fill, font, align
+    summary_ws["B1"].fill, summary_ws["B1"].font, summary_ws["B1"].alignment = styles["header"]
 
     # Info dictionaries
-    num_rows = len(df)
     date_obj = datetime.strptime(user_info["DateToday"], "%Y%m%d")
     summary_info = {
         "B3": "Completed By:", "D3": user_info["CompletedBy"],
         "B4": "Date:", "D4": date_obj,
         "B5": "Company:", "D5": user_info["CompanyName"],
-        "B6": "Total Samples:", "D6": num_rows,
+        "B6": "Total Samples:", "D6": summary.rows,
         "B7": "Score:", "D7": ""
     }
     summary_ws["D4"].number_format = "DD-MMM-YYYY"
@@ -382,27 +1597,25 @@ def format_excel(df, save_path, user_info):
         summary_ws.merge_cells(rng)
 
     # Apply values, borders, and styles
-    all_info = {**summary_info, **units_info}
-    for cell, value in all_info.items():
+    thin_box = Border(top=THIN, bottom=THIN, left=THIN, right=THIN)
+    for cell, value in {**summary_info, **units_info}.items():
         c = summary_ws[cell]
         c.value = value
-        c.border = Border(top=thin, bottom=thin, left=thin, right=thin)
+        c.border = thin_box
         style_key = "subheader" if cell == "N3" else "light" if cell.startswith(("B", "N")) else "white"
-        fill, font, align = styles[style_key]
-        c.fill, c.font, c.alignment = fill, font, align
+        c.fill, c.font, c.alignment = styles[style_key]
 
     # Apply top/bottom borders to merged cells (C, E, Q columns)
+    top_bottom = Border(top=THIN, bottom=THIN)
     for col in ["C", "E", "O", "Q"]:
         for row in range(3, 8):
-            cell = f"{col}{row}"
-            summary_ws[cell].border = Border(top=thin, bottom=thin)
+            summary_ws[f"{col}{row}"].border = top_bottom
 
     # Chemicals Table
     start_row = 11
     summary_ws.merge_cells("B9:Q9")
     summary_ws["B9"] = "ANALYSIS SUMMARY"
-    for fill, font, align in [styles["header"]]:
-        summary_ws["B9"].fill, summary_ws["B9"].font, summary_ws["B9"].alignment = fill, font, align
+    summary_ws["B9"].fill, summary_ws["B9"].font, summary_ws["B9"].alignment = styles["header"]
 
     categories = ["TOTAL SAMPLES", "PASS", "FAIL", "SCORE", "PRIORITY"]
     blocks = [(3, 4), (5, 6), (7, 8), (9, 10), (11, 12)]
@@ -412,23 +1625,29 @@ def format_excel(df, save_path, user_info):
         cell.value, cell.fill, cell.font, cell.alignment = cat, *styles["subheader"]
 
     row = start_row
-    for chem in chemicals:
-        chem_df = df[df["CHEMICAL"] == chem]
-        total, acceptable = len(chem_df), len(chem_df[chem_df["STATUS"] == "COMPLIANT"])
-        percent = acceptable / total if total else 0
+    row_style = {}  # cells of the first chemical row, whose styles are copied onto the rest
+    table = zip(stats["TOTAL"].tolist(), stats["PASS"].tolist(), stats["FAIL"].tolist(), stats["SCORE"].tolist(),
+                stats["PRIORITY"].tolist())
+    for chem, (total, passed, failed, score, priority) in zip(chemicals, table):
         values = [
-            (3, 4, total), (5, 6, acceptable), (7, 8, total - acceptable),
-            (9, 10, percent, "0.00%"), (11, 12, "HIGH" if percent < 0.45 else "LOW" if percent > 0.55 else "MEDIUM")
+            (3, 4, total), (5, 6, passed), (7, 8, failed), (9, 10, score, "0.00%"), (11, 12, priority)
         ]
         
         summary_ws[f"B{row}"] = chem
-        summary_ws[f"B{row}"].fill, summary_ws[f"B{row}"].font, summary_ws[f"B{row}"].alignment = styles["light"]
-        
         for start, end, val, *fmt in values:
-            summary_ws.merge_cells(start_row=row, start_column=start, end_row=row, end_column=end)
-            cell = summary_ws.cell(row, start)
-            cell.value, cell.fill, cell.alignment = val, white_fill, Alignment(horizontal="center", vertical="center")
-            if fmt: cell.number_format = fmt[0]
+            _merge(summary_ws, row, start, row, end)
+            summary_ws.cell(row, start).value = val
+
+        if row_style:
+            for col, first in row_style.items():
+                _copy_style(first, summary_ws.cell(row, col))
+        else:
+            summary_ws[f"B{row}"].fill, summary_ws[f"B{row}"].font, summary_ws[f"B{row}"].alignment = styles["light"]
+            for start, end, val, *fmt in values:
+                cell = summary_ws.cell(row, start)
+                cell.fill, cell.alignment = WHITE_FILL, CENTER
+                if fmt: cell.number_format = fmt[0]
+            row_style = {col: summary_ws.cell(row, col) for col in [2] + [v[0] for v in values]}
 
         row += 1
 
@@ -441,38 +1660,34 @@ def format_excel(df, save_path, user_info):
         cell.fill, cell.font, cell.alignment = styles["subheader"]
         if formula: cell.value = f"={formula}"
     
-    weights = f"=SUM({'+'.join(f'I{r}*(C{r}/100)' for r in range(start_row, row))})"
-    summary_ws[f"I{row}"] = weights
+    # Sum of SCORE x TOTAL/100 over the chemicals
+    if score_formula and chemicals:
+        summary_ws[f"I{row}"] = f"=SUMPRODUCT(I{start_row}:I{row-1},C{start_row}:C{row-1})/100"
+        summary_ws["D7"] = f"=I{row}"
+    else:
+        weights = sum(score * (total / 100) for score, total in zip(stats["SCORE"].tolist(), stats["TOTAL"].tolist()))
+        summary_ws[f"I{row}"] = summary_ws["D7"] = weights
     summary_ws[f"I{row}"].number_format = "0.00%"
-    summary_ws[f"D7"] = f"=I{row}"
-    summary_ws[f"D7"].number_format = "0.00%"
+    summary_ws["D7"].number_format = "0.00%"
     summary_ws.merge_cells(start_row=row, start_column=11, end_row=row, end_column=12)
- 
-    
-
-    #Pie chart via Matplotlib
-    pass_count = (df["STATUS"] == "COMPLIANT").sum()        
-    fail_count = (df["STATUS"] == "NON-COMPLIANT").sum()
-    summary_ws = wb["Summary"]  # or whichever sheet you want
-    add_pass_fail_chart(summary_ws, pass_count, fail_count, cell="M11")
 
-    print(pass_count)
-    print(fail_count)
-    print(start_row)
-    print(row-1)
+    # Pie chart of the PASS / FAIL totals
+    pass_count = summary.pass_count
+    fail_count = summary.fail_count
+    if chart == "native":
+        add_native_pass_fail_chart(summary_ws, (f"E{row}", f"G{row}"), ("E10", "G10"),
+                                   (pass_count, fail_count), cell="M11")
+    elif chart == "image":
+        add_pass_fail_chart(summary_ws, pass_count, fail_count, cell="M11")
 
     # ----  fills ----
-    gray_fill = PatternFill(start_color="ADADAD", end_color="ADADAD", fill_type="solid") #Grey
-    summary_ws["B10"].fill = gray_fill # Row 10 header fills
+    summary_ws["B10"].fill = SUBHEADER_FILL # Row 10 header fills
     for col in range(13, 18):  # M=13, Q=17
-        summary_ws.cell(row=10, column=col).fill = gray_fill
+        summary_ws.cell(row=10, column=col).fill = SUBHEADER_FILL
 
-    summary_ws[f"B{row}"].fill = gray_fill # Bottom row fills (row = number of chemicals + 10)
+    summary_ws[f"B{row}"].fill = SUBHEADER_FILL # Bottom row fills (row = number of chemicals + 10)
     for col in range(11, 18):  # K=11, Q=17
-        summary_ws.cell(row=row, column=col).fill = gray_fill
-
-
-
+        summary_ws.cell(row=row, column=col).fill = SUBHEADER_FILL
 
     # Ranges Table
     ranges_header = row + 2
@@ -491,24 +1706,28 @@ def format_excel(df, save_path, user_info):
         for start, _ in category_blocks:
             cell = summary_ws.cell(ranges_header+2, start + offset)
             cell.value = sub
-            cell.fill, cell.font, cell.alignment = light_fill, Font(color="000000", bold=True), Alignment(horizontal="center", vertical="center")
+            cell.fill, cell.font, cell.alignment = LIGHT_FILL, styles["subheader"][1], CENTER
 
     r = ranges_header + 3
-    for chem in chemicals:
-        chem_df = df[df["CHEMICAL"] == chem]
-        summary_ws.cell(r, 2, chem).fill = styles["light"][0]
-        for i, col in enumerate(["CONCENTRATION", "pH LEVEL", "TEMPERATURE", "PRESSURE", "FLOW RATE"]):
-            start = category_blocks[i][0]
-            for j, val in enumerate([chem_df[col].min(), chem_df[col].max(), chem_df[col].mean()]):
-                summary_ws.cell(r, start + j).value = val
-                summary_ws.cell(r, start + j).alignment = Alignment(horizontal="center", vertical="center")
+    # RANGE_STAT_COLS runs MIN/MAX/MEAN per measurement across columns C:Q
+    row_style = {}
+    for chem, values in zip(chemicals, stats[RANGE_STAT_COLS].to_numpy()):
+        summary_ws.cell(r, 2, chem)
+        for col, value in enumerate(values, start=category_blocks[0][0]):
+            summary_ws.cell(r, col).value = value
+        if row_style:
+            for col, first in row_style.items():
+                _copy_style(first, summary_ws.cell(r, col))
+        else:
+            summary_ws.cell(r, 2).fill = LIGHT_FILL
+            for col in range(category_blocks[0][0], category_blocks[-1][1] + 1):
+                summary_ws.cell(r, col).alignment = CENTER
+            row_style = {col: summary_ws.cell(r, col) for col in range(2, category_blocks[-1][1] + 1)}
         r += 1
 
-    
     rBlank = ranges_header + 1
-    summary_ws.cell(rBlank, 2).fill = PatternFill(start_color="ADADAD", end_color="ADADAD", fill_type="solid")
-    summary_ws.cell(rBlank+1, 2).fill = PatternFill(start_color="E8E8E8", end_color="E8E8E8", fill_type="solid")
-    
+    summary_ws.cell(rBlank, 2).fill = SUBHEADER_FILL
+    summary_ws.cell(rBlank+1, 2).fill = LIGHT_FILL
 
     # Column Widths and Borders
     summary_ws.column_dimensions["A"].width = 0.7
@@ -516,104 +1735,1610 @@ def format_excel(df, save_path, user_info):
     for col in range(3, 18):
         summary_ws.column_dimensions[get_column_letter(col)].width = 9.4
 
-
-    def apply_thin_border(ws, cell_range):
-        rows = ws[cell_range]
-        for row in rows:
-            for cell in row:
-                borders = {k: cell.border.__dict__[k] for k in ("left", "right", "top", "bottom")}
-                if cell.column == rows[0][0].column: borders["left"] = thin
-                if cell.column == rows[0][-1].column: borders["right"] = thin
-                cell.border = Border(**borders)
-                
     for start, end in category_blocks:
-        apply_thin_border(summary_ws, f"{get_column_letter(start)}{ranges_header+1}:{get_column_letter(end)}{r-1}")
-
-
-
-    def apply_thick_border(ws, cell_range):
-        rows = ws[cell_range]
-        for row in rows:
-            for cell in row:
-                borders = {k: cell.border.__dict__[k] for k in ("left", "right", "top", "bottom")}
-                if cell.row == rows[0][0].row: borders["top"] = thick
-                if cell.row == rows[-1][0].row: borders["bottom"] = thick
-                if cell.column == rows[0][0].column: borders["left"] = thick
-                if cell.column == rows[0][-1].column: borders["right"] = thick
-                cell.border = Border(**borders)
+        _outline(summary_ws, f"{get_column_letter(start)}{ranges_header+1}:{get_column_letter(end)}{r-1}", left=THIN, right=THIN)
 
     for rng in ["B1:Q1", "B3:E7", "N3:Q7", "B9:Q9", f"B10:Q{row}", f"M11:Q{row-1}", f"B{ranges_header}:Q{ranges_header+len(chemicals)+2}", f"B{ranges_header}:Q{ranges_header}"]:
-        apply_thick_border(summary_ws, rng)
-
-
-
-
-    def apply_double_bottom(ws, cell_range):
-        rows = ws[cell_range]
-        for row in rows:
-            for cell in row:
-                borders = {k: cell.border.__dict__[k] for k in ("left", "right", "top", "bottom")}
-                if cell.row == rows[-1][0].row: borders["bottom"] = double_bottom
-                if cell.column == rows[0][0].column: borders["left"] = thick
-                if cell.column == rows[0][-1].column: borders["right"] = thick
-                cell.border = Border(**borders)
+        _outline(summary_ws, rng, top=THICK, bottom=THICK, left=THICK, right=THICK)
 
     for rng in ["N3:Q3","B10:Q10",f"B{ranges_header-3}:Q{ranges_header-3}",f"B{ranges_header+2}:Q{ranges_header+2}"]:
-        apply_double_bottom(summary_ws, rng)
+        _outline(summary_ws, rng, bottom=DOUBLE_BOTTOM, left=THICK, right=THICK)
+
+    # Sample Data shards table, only when the rows did not fit on one sheet
+    if len(shards) > 1:
+        from openpyxl.utils import quote_sheetname
+        from openpyxl.worksheet.hyperlink import Hyperlink
+
+        shards_header = r + 1
+        summary_ws.merge_cells(f"B{shards_header}:Q{shards_header}")
+        summary_ws[f"B{shards_header}"] = "SAMPLE DATA"
+        summary_ws[f"B{shards_header}"].fill, summary_ws[f"B{shards_header}"].font, summary_ws[f"B{shards_header}"].alignment = styles["header"]
+        for part, (title, file_name, rows) in enumerate(shards, 1):
+            link_row = shards_header + part
+            summary_ws[f"B{link_row}"] = f"PART {part}"
+            summary_ws[f"B{link_row}"].fill, summary_ws[f"B{link_row}"].font, summary_ws[f"B{link_row}"].alignment = styles["light"]
+            summary_ws.merge_cells(start_row=link_row, start_column=3, end_row=link_row, end_column=12)
+            cell = summary_ws.cell(link_row, 3, f"{file_name} ({title})" if file_name else title)
+            cell.hyperlink = Hyperlink(ref=cell.coordinate, target=file_name, location=f"{quote_sheetname(title)}!A1")
+            cell.font, cell.alignment = LINK_FONT, Alignment(horizontal="left", vertical="center", indent=1)
+            summary_ws.merge_cells(start_row=link_row, start_column=13, end_row=link_row, end_column=17)
+            cell = summary_ws.cell(link_row, 13, rows)
+            cell.number_format, cell.alignment = '#,##0" rows"', CENTER
+        _outline(summary_ws, f"B{shards_header}:Q{shards_header + len(shards)}", top=THICK, bottom=THICK, left=THICK, right=THICK)
+        _outline(summary_ws, f"B{shards_header}:Q{shards_header}", bottom=DOUBLE_BOTTOM)
+
+
+def write_table_sheet(ws, table: pd.DataFrame, number_formats=None):
+    """Plain boxed table with a Summary-style header row; NaN becomes an empty cell."""
+    number_formats = number_formats or {}
+    fill, font, _ = SUMMARY_STYLES["header"]
+    thin_box = Border(top=THIN, bottom=THIN, left=THIN, right=THIN)
+    for col, name in enumerate(table.columns, start=1):
+        cell = ws.cell(1, col, name)
+        cell.fill, cell.font, cell.alignment, cell.border = fill, font, CENTER, thin_box
+        ws.column_dimensions[get_column_letter(col)].width = max(12, len(name) + 2)
+    if len(table.columns):
+        ws.column_dimensions["A"].width = max([12] + [len(str(c)) + 2 for c in table.iloc[:, 0]])
+    for row, values in enumerate(table.itertuples(index=False), start=2):
+        for col, (name, value) in enumerate(zip(table.columns, values), start=1):
+            if isinstance(value, numbers.Real) and not np.isfinite(value):
+                value = None
+            cell = ws.cell(row, col, value.item() if isinstance(value, np.generic) else value)
+            cell.border = thin_box
+            if name in number_formats:
+                cell.number_format = number_formats[name]
+    ws.freeze_panes = "A2"
+
+def write_trends_sheet(ws, trends: pd.DataFrame):
+    """Fill the Trends sheet: one row per chemical and measurement, flagged trends in bold."""
+    write_table_sheet(ws, trends, {"MOVING MEAN": "0.00", "MOVING STD": "0.00", "HEADROOM": "0.0%",
+                                   "DRIFT PER SAMPLE": "0.000", "SAMPLES TO LIMIT": "0.0"})
+    bold = Font(bold=True)
+    col = TREND_COLS.index("TREND") + 1
+    for row, value in enumerate(trends["TREND"], start=2):
+        if value in TREND_FLAGS:
+            ws.cell(row, col).font = bold
+
+def _copy_to_write_only(src, dst):
+    """Replay a small, fully built worksheet into a write-only worksheet."""
+    for key, dim in src.column_dimensions.items():
+        if dim.width:
+            dst.column_dimensions[key].width = dim.width
+    dst.freeze_panes = src.freeze_panes
+    dst.merged_cells.ranges.update(src.merged_cells.ranges)  # already disjoint; skip openpyxl's overlap scan
+    for img in src._images:
+        dst.add_image(img)
+    for chart in src._charts:
+        dst.add_chart(chart)
+    styles = {}  # source style -> first destination cell with it, so each distinct style is registered once
+    for src_row in src.iter_rows():
+        row = []
+        for src_cell in src_row:
+            cell = src_cell.value
+            if src_cell.has_style or src_cell.hyperlink:
+                cell = WriteOnlyCell(dst, src_cell.value)
+                key = tuple(src_cell._style) if OPENPYXL_FAST_PATH else None
+                if key in styles:
+                    _copy_style(styles[key], cell)
+                else:
+                    cell.font, cell.fill, cell.border = copy(src_cell.font), copy(src_cell.fill), copy(src_cell.border)
+                    cell.alignment, cell.number_format = copy(src_cell.alignment), src_cell.number_format
+                    if key is not None:
+                        styles[key] = cell
+                if src_cell.hyperlink:
+                    cell.hyperlink = copy(src_cell.hyperlink)
+            row.append(cell)
+        dst.append(row)
+
+def format_excel(df, save_path, user_info, options=ReportOptions(), *, summary=None, trends=None, announce=True):
+    """Format the Excel output.
+
+    ``df`` is either a checked DataFrame or an iterable of checked chunks (see
+    ``iter_compliance_chunks``); the Summary sheet is built from aggregates either way.
+    With ``options.write_only`` the Sample Data sheet is streamed to disk as it is written.
+    A ``summary`` passed in is reported instead of the one aggregated from ``df``; it is
+    only read once ``df`` has been consumed (see IncrementalRun).
+
+    Sample Data is split every ``options.shard_rows`` rows (default: Excel's sheet limit)
+    into more sheets or, with ``shard_mode="workbooks"``, separate streamed workbooks; the
+    Summary sheet links to every part. With a ``trends`` TrendTracker (fed from ``df``
+    by the caller) a Trends sheet follows the Sample Data. ``chart`` and ``score_formula``
+    are passed to write_summary_sheet. ``announce=False`` skips the "saved at" message.
+    """
+    write_only = options.write_only
+    shard_rows = options.shard_rows or EXCEL_MAX_ROWS - 2
+    # Create workbook with Summary as the first sheet and Sample Data second
+    wb = openpyxl.Workbook(write_only=write_only)
+    summary_ws = wb.create_sheet("Summary") if write_only else wb.active
+    summary_ws.title = "Summary"
+    ws = wb.create_sheet("Sample Data")
 
-    #For col in range(2, 18): 
-    #    cell = summary_ws.cell(row=10, column=col)
-    #    cell.border = double_bottom
+    shards = SampleDataShards(ws, save_path, options.shard_mode)
+    with stage("write_sample_data") as st:
+        try:
+            streamed = write_sample_data(ws, df, shard_rows, shards)
+        finally:
+            shards.close()
+        st.rows = streamed.rows
+    summary = streamed if summary is None else summary
+    parts = [(title, file_name, min(shard_rows, streamed.rows - i * shard_rows))
+             for i, (title, file_name) in enumerate(shards.parts)]
+    with stage("write_summary_sheet"):
+        if write_only:
+            # The Summary is small; build it normally, then stream it into place
+            scratch = openpyxl.Workbook().active
+            scratch.title = summary_ws.title  # chart references name the sheet
+            write_summary_sheet(scratch, summary, user_info, chart=options.chart, shards=parts,
+                                score_formula=options.score_formula)
+            _copy_to_write_only(scratch, summary_ws)
+        else:
+            write_summary_sheet(summary_ws, summary, user_info, chart=options.chart, shards=parts,
+                                score_formula=options.score_formula)
+            # Ensure Summary is the active sheet
+            wb.active = summary_ws
+    if trends is not None:
+        with stage("write_trends_sheet"):
+            trends_ws = wb.create_sheet("Trends")
+            if write_only:
+                scratch = openpyxl.Workbook().active
+                write_trends_sheet(scratch, trends.to_frame())
+                _copy_to_write_only(scratch, trends_ws)
+            else:
+                write_trends_sheet(trends_ws, trends.to_frame())
+
+    with stage("save_workbook", streamed.rows):
+        wb.save(save_path)
+    if announce:
+        print(f"Final formatted report saved at: {save_path}")
+    return summary
+
+
+
+# -------------------- Output Backends --------------------
+class ResultWriter:
+    """Base for the result writers: open at a path, write() chunks, close()."""
+    extension = ""
+
+    @classmethod
+    def save(cls, path, table):
+        """Write one whole table (the summary and trends files)."""
+        writer = cls(path)
+        try:
+            writer.write(table)
+        finally:
+            writer.close()
+
+class CsvResults(ResultWriter):
+    """Plain CSV, header written once, one chunk appended at a time."""
+    extension = ".csv"
+
+    def __init__(self, path):
+        self.fh = open(path, "w", newline="", encoding="utf-8")
+        self.header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self.fh, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.fh.close()
+
+class JsonLinesResults(ResultWriter):
+    """One JSON object per row; NaN becomes null."""
+    extension = ".jsonl"
+
+    def __init__(self, path):
+        self.fh = open(path, "w", encoding="utf-8")
+
+    def write(self, chunk):
+        if len(chunk):
+            text = chunk.to_json(orient="records", lines=True, date_format="iso")
+            self.fh.write(text if text.endswith("\n") else text + "\n")
+
+    def close(self):
+        self.fh.close()
+
+def _as_text(col: pd.Series) -> pd.Series:
+    """Column as strings, blanks kept missing; whole floats lose the ".0" read_csv gives them."""
+    if col.dtype.kind == "f":
+        text = col.astype(object)
+        whole = col.notna() & (col % 1 == 0)
+        text[whole] = col[whole].astype(np.int64).astype(str)
+        text[col.notna() & ~whole] = col[col.notna() & ~whole].astype(str)
+        col = text
+    return col.astype("string")
+
+class ParquetResults(ResultWriter):
+    """Parquet via pyarrow (optional dependency), one row group per chunk.
+
+    Streamed rows get a schema fixed up front: measurements float64, every other column
+    text. A column read_csv types from one chunk alone (blank Notes, numeric-looking
+    SAMPLE IDs) then cannot clash with what later chunks hold.
+    """
+    extension = ".parquet"
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)") from None
+        self.pa, self.pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.writer = None
+
+    @classmethod
+    def save(cls, path, table):
+        # A single table has nothing to line up with: keep its own types (counts stay integers)
+        writer = cls(path)
+        writer.pq.write_table(writer.pa.Table.from_pandas(widen_frame(table), preserve_index=False), path)
+
+    def write(self, chunk):
+        chunk = widen_frame(chunk)
+        if self.writer is None:
+            schema = self.pa.schema([(name, self.pa.float64() if name in MEASUREMENT_COLS else self.pa.string())
+                                     for name in chunk.columns])
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+        frame = pd.DataFrame({name: pd.to_numeric(col, errors="coerce").astype(np.float64)
+                              if name in MEASUREMENT_COLS else _as_text(col)
+                              for name, col in chunk.items()}, index=chunk.index)
+        self.writer.write_table(self.pa.Table.from_pandas(frame, schema=self.writer.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+# Format name -> writer class. "xlsx" is the styled report and handled by format_excel;
+# "rollup" is the mergeable summary artifact (see save_summary_artifact).
+RESULT_WRITERS = {"csv": CsvResults, "jsonl": JsonLinesResults, "parquet": ParquetResults}
+OUTPUT_FORMATS = ("xlsx",) + tuple(RESULT_WRITERS) + ("rollup",)
+ROLLUP_SUFFIX = "_rollup.json"
+ROLLUP_VERSION = 1  # bump when the artifact layout changes
+
+def output_paths(save_path, formats=("xlsx",), trends=False):
+    """Files written for each format: {fmt: (rows_path, summary_path[, trends_path])}.
+
+    Everything shares the report's stem plus a RESULT_SUFFIXES suffix, so a rows file
+    never takes a bare ``<stem>.csv`` an input may already use; the styled workbook
+    holds them all in one file.
+    """
+    stem = os.path.splitext(save_path)[0]
+    paths = {}
+    for fmt in formats:
+        if fmt == "xlsx":
+            paths[fmt] = (save_path,)
+        elif fmt == "rollup":
+            paths[fmt] = (stem + ROLLUP_SUFFIX,)
+        else:
+            ext = RESULT_WRITERS[fmt].extension
+            rows, summary, trend = (stem + suffix + ext for suffix in RESULT_SUFFIXES)
+            paths[fmt] = (rows, summary) + ((trend,) if trends else ())
+    return paths
+
+def write_outputs(chunks, save_path, user_info, options=ReportOptions(), *, summary=None, trends=None):
+    """Write checked chunks to every format in ``options.formats`` in a single pass; returns the ComplianceSummary.
+
+    ``summary`` overrides the aggregate of ``chunks``, and the workbook follows
+    ``options`` as in format_excel. A ``trends`` TrendTracker is fed every chunk; its
+    table goes in the workbook's Trends sheet and a ``_trends`` file per other format,
+    and its history is saved.
+    """
+    formats = options.formats
+    paths = output_paths(save_path, formats, trends is not None)
+    writers = [(fmt, RESULT_WRITERS[fmt](paths[fmt][0])) for fmt in formats if fmt in RESULT_WRITERS]
+
+    def tee():
+        for chunk in chunks:
+            if trends is not None:
+                with stage("trends", len(chunk)):
+                    trends.update(chunk)
+            for fmt, writer in writers:
+                with stage(f"write_{fmt}", len(chunk)):
+                    writer.write(chunk)
+            yield chunk
 
+    try:
+        if "xlsx" in formats:
+            summary = format_excel(tee(), save_path, user_info, options, summary=summary, trends=trends)
+        elif summary is None:
+            summary = ComplianceSummary()
+            for chunk in tee():
+                with stage("summarize", len(chunk)):
+                    summary.update(chunk)
+        else:
+            for _ in tee():
+                pass
+    finally:
+        for _, writer in writers:
+            writer.close()
+
+    stats = summary.to_frame().rename_axis("CHEMICAL").reset_index()
+    for fmt in formats:
+        if fmt == "rollup":
+            save_summary_artifact(summary, paths[fmt][0], user_info, os.path.basename(save_path))
+            print(f"Rollup summary saved at: {paths[fmt][0]}")
+        if fmt not in RESULT_WRITERS:
+            continue
+        RESULT_WRITERS[fmt].save(paths[fmt][1], stats)
+        print(f"{fmt} results saved at: {paths[fmt][0]} (summary: {paths[fmt][1]})")
+    if trends is not None:
+        table = trends.to_frame()
+        for fmt in formats:
+            if fmt in RESULT_WRITERS:
+                RESULT_WRITERS[fmt].save(paths[fmt][2], table)
+        trends.save()
+        flagged = trends.flagged(table)
+        print(f"Trends: {len(flagged)} chemical(s) violating or trending toward a limit"
+              + (f": {', '.join(map(str, flagged))}" if flagged else ""))
+    return summary
+
+
+def save_summary_artifact(summary: ComplianceSummary, path, user_info, report=None):
+    """Write a run's mergeable summary (ComplianceSummary partials plus who/where/when) as JSON."""
+    artifact = {
+        "version": ROLLUP_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "report": report,
+        "company": user_info["CompanyName"],
+        "completed_by": user_info["CompletedBy"],
+        "date": user_info["DateToday"],
+        **summary.to_dict(),
+    }
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(artifact, fh)
+
+def load_summary_artifact(path) -> dict:
+    """Read a rollup artifact; ComplianceSummary.from_dicts turns artifacts back into a summary."""
+    with open(path, encoding="utf-8") as fh:
+        artifact = json.load(fh)
+    if artifact.get("version") != ROLLUP_VERSION:
+        raise ValueError(f"{path}: unsupported rollup version {artifact.get('version')!r}")
+    return artifact
+
+
+# -------------------- Consolidation --------------------
+SOURCE_COLS = ["ARTIFACT", "REPORT", "COMPANY", "DATE", "COMPLETED BY", "TOTAL", "PASS", "FAIL", "SCORE"]
+
+def collect_rollup_paths(inputs):
+    """Expand artifact files and directories (searched recursively) into a sorted list of rollup paths."""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "**", "*" + ROLLUP_SUFFIX), recursive=True)))
+        else:
+            paths.append(path)
+    return paths
+
+def consolidate_summaries(artifact_paths, save_path, user_info, options=ReportOptions()):
+    """Merge per-run rollup artifacts into one Summary workbook; returns the merged ComplianceSummary.
+
+    Only the per-chemical partials are read, so the cost follows artifacts x chemicals,
+    never the raw rows. A Sources sheet lists every artifact with its own totals. Only
+    ``options.chart`` and ``options.score_formula`` apply.
+    """
+    with stage("read_artifacts"):
+        artifacts = [load_summary_artifact(path) for path in artifact_paths]
+    with stage("merge_summaries"):
+        summary = ComplianceSummary.from_dicts(artifacts)
+    sources = pd.DataFrame([
+        [path, a["report"], a["company"], a["date"], a["completed_by"], a["rows"], a["pass"], a["rows"] - a["pass"],
+         a["pass"] / a["rows"] if a["rows"] else 0.0]
+        for path, a in zip(artifact_paths, artifacts)], columns=SOURCE_COLS)
+
+    with stage("write_summary_sheet"):
+        wb = openpyxl.Workbook()
+        summary_ws = wb.active
+        summary_ws.title = "Summary"
+        write_summary_sheet(summary_ws, summary, user_info, chart=options.chart, score_formula=options.score_formula)
+        write_table_sheet(wb.create_sheet("Sources"), sources, {"TOTAL": "#,##0", "PASS": "#,##0", "FAIL": "#,##0",
+                                                                "SCORE": "0.00%"})
+    with stage("save_workbook"):
+        wb.save(save_path)
+    print(f"Consolidated {len(artifacts)} summaries ({summary.rows:,} samples, {len(summary.table)} chemicals) "
+          f"into: {save_path}")
+    return summary
+
+
+# -------------------- Incremental Runs --------------------
+# Measurement columns as stored in the state database
+_STATE_VALUE_COLS = {col: col.lower().replace(" ", "_") for col in MEASUREMENT_COLS}
+STATE_VERSION = 1  # bump when compliance_bits' results change, to re-check every stored row
+
+_STATE_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS samples (
+    dataset TEXT NOT NULL,
+    sample_key TEXT NOT NULL,
+    chemical TEXT,
+    row_hash INTEGER NOT NULL,
+    limits_version INTEGER NOT NULL,
+    fail_bits INTEGER NOT NULL,
+    {", ".join(f"{name} REAL" for name in _STATE_VALUE_COLS.values())},
+    PRIMARY KEY (dataset, sample_key)
+);
+CREATE INDEX IF NOT EXISTS samples_by_chemical ON samples (dataset, chemical);
+CREATE TABLE IF NOT EXISTS partials (
+    dataset TEXT NOT NULL,
+    chemical TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    PRIMARY KEY (dataset, chemical)
+);
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL,
+    pass_count INTEGER NOT NULL,
+    fail_count INTEGER NOT NULL,
+    updated TEXT NOT NULL
+);
+"""
+
+def _open_state(state_path):
+    import sqlite3  # only incremental runs need it
+
+    con = sqlite3.connect(state_path, timeout=300)  # batch workers queue for the write lock
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_STATE_SCHEMA)
+    return con
+
+def limits_versions(limits: RangeLimits) -> np.ndarray:
+    """64-bit fingerprint of each chemical's (or rule's) compiled limits, indexed by limit_codes (-1 -> 0)."""
+    versions = [
+        int.from_bytes(hashlib.sha1(np.concatenate([[STATE_VERSION, limits.ambiguous[i]], limits.bounds[i, :, 0],
+                                                    limits.bounds[i, :, 1]]).tobytes()).digest()[:8], "little",
+                       signed=True)
+        for i in range(len(limits.bounds) - 1)
+    ]
+    return np.array(versions + [0], dtype=np.int64)
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """64-bit hash of each row's CHEMICAL and measurements (the inputs to its check)."""
+    cols = {}
+    for col in REQUIRED_CHECK_COLS:
+        values = df[col]
+        # Numbers hash as float64 so an int column that picks up a NaN keeps its hashes
+        cols[col] = values.astype("float64") if pd.api.types.is_numeric_dtype(values.dtype) else values.astype(str)
+    return pd.util.hash_pandas_object(pd.DataFrame(cols), index=False).to_numpy().view(np.int64)
+
+def _sample_keys(df: pd.DataFrame, counts: dict, offset: int) -> np.ndarray:
+    """State keys for a chunk: SAMPLE ID, with "#n" for its n-th repeat in the file.
+
+    ``counts`` carries the per-ID tally from chunk to chunk. Files without a SAMPLE ID
+    column are keyed by row number.
+    """
+    if "SAMPLE ID" not in df:
+        return np.array([f"row {n}" for n in range(offset, offset + len(df))], dtype=object)
+    keys = []
+    for sample_id in df["SAMPLE ID"].astype(str).to_numpy(dtype=object):
+        n = counts.get(sample_id, 0)
+        counts[sample_id] = n + 1
+        keys.append(f"{sample_id}#{n}" if n else sample_id)
+    return np.array(keys, dtype=object)
+
+def _status_counts(fail_bits) -> np.ndarray:
+    """[rows, compliant, non-compliant] for stored fail bits (-1 = unknown chemical)."""
+    return np.array([len(fail_bits), (fail_bits == 0).sum(), (fail_bits > 0).sum()], dtype=np.int64)
+
+class IncrementalRun:
+    """Check a CSV against a SQLite state store, re-checking only the rows that need it.
+
+    Per dataset (by default the CSV's absolute path) the store keeps each row's key,
+    a hash of its check inputs, the version of its chemical's limits, its failed-check
+    bits and its numeric values, plus the per-chemical Summary partials and run totals.
+    A row is re-checked only if it is new, its hash changed or its chemical's limits
+    changed; STATUS and COMMENT of the others are rebuilt from their stored bits.
+    Partials of untouched chemicals are reused and extended with the new rows; chemicals
+    with changed or removed rows are re-aggregated from the store.
+    """
+
+    def __init__(self, state_path, dataset):
+        self.state_path = state_path
+        self.dataset = dataset
+        self.summary = ComplianceSummary()  # filled in once chunks() is exhausted
+        self.stats = {"rows": 0, "checked": 0, "new": 0, "changed": 0, "removed": 0}
+
+    def chunks(self, csv_path, ranges_df: pd.DataFrame, chunksize: int = CHUNK_SIZE):
+        """Yield checked chunks like iter_compliance_chunks; the store is committed at the end."""
+        limits = range_limits(ranges_df)
+        versions = limits_versions(limits)
+        con = _open_state(self.state_path)
+        try:
+            with stage("state_store"):
+                stored = con.execute("SELECT sample_key, row_hash, limits_version, fail_bits, chemical FROM samples "
+                                     "WHERE dataset = ?", (self.dataset,)).fetchall()
+            stored_keys = pd.Index([row[0] for row in stored], dtype=object)
+            stored_hash, stored_version, stored_bits = (
+                np.array([row[i] for row in stored], dtype=np.int64).reshape(-1) for i in (1, 2, 3))
+            stored_chem = np.array([row[4] for row in stored], dtype=object)  # to mark edited/removed rows dirty
+            del stored
+            seen = np.zeros(len(stored_keys), dtype=bool)
+
+            totals = self._load_totals(con)
+            added = ComplianceSummary()  # rows the store has never seen
+            dirty = set()  # chemicals whose partials must be rebuilt
+            counts = {}
+            upsert = (f"INSERT OR REPLACE INTO samples (dataset, sample_key, chemical, row_hash, limits_version, "
+                      f"fail_bits, {', '.join(_STATE_VALUE_COLS.values())}) "
+                      f"VALUES ({', '.join('?' * (6 + len(_STATE_VALUE_COLS)))})")
+
+            for chunk in iter_standardized_chunks(csv_path, chunksize, limits.rules is not None):
+                with stage("check_compliance", len(chunk)):
+                    keys = _sample_keys(chunk, counts, self.stats["rows"])
+                    codes = limit_codes(chunk, limits)
+                    row_version = versions[codes]
+                    row_hash = _row_hashes(chunk)
+
+                    pos = stored_keys.get_indexer(keys)
+                    found = pos >= 0
+                    same_row = found.copy()
+                    same_row[found] = stored_hash[pos[found]] == row_hash[found]
+                    same = same_row.copy()
+                    same[found] &= stored_version[pos[found]] == row_version[found]
+                    seen[pos[found]] = True
+                    todo, changed = ~same, found & ~same
+
+                    fail_bits = np.empty(len(chunk), dtype=np.int64)
+                    fail_bits[same] = stored_bits[pos[same]]
+                    fail_bits[todo] = compliance_bits(chunk[todo], limits, codes[todo])
+                    fail_bits[codes < 0] = -1
+                    chunk["STATUS"], chunk["COMMENT"] = describe_compliance(codes, fail_bits, ranges_df, limits)
+                    if limits.rules is not None:
+                        chunk["RULE"] = rule_labels(codes, limits)
+
+                with stage("state_store", int(todo.sum())):
+                    # A re-limited row kept its chemical; an edited one may have moved from another
+                    dirty.update(chunk["CHEMICAL"].to_numpy()[changed])
+                    dirty.update(stored_chem[pos[found & ~same_row]])
+                    if todo.any():
+                        values = chunk.loc[todo, MEASUREMENT_COLS].apply(pd.to_numeric, errors="coerce")
+                        chem = chunk.loc[todo, "CHEMICAL"].astype(object)
+                        con.executemany(upsert, zip(
+                            [self.dataset] * int(todo.sum()), keys[todo], chem.where(chem.notna(), None),
+                            row_hash[todo].tolist(), row_version[todo].tolist(), fail_bits[todo].tolist(),
+                            *(values[col].tolist() for col in MEASUREMENT_COLS)))
+                    totals += _status_counts(fail_bits[todo]) - _status_counts(stored_bits[pos[changed]])
+                    if (~found).any():
+                        added.update(chunk[~found])
+
+                self.stats["rows"] += len(chunk)
+                self.stats["checked"] += int(todo.sum())
+                self.stats["new"] += int((~found).sum())
+                self.stats["changed"] += int(changed.sum())
+                yield chunk
+
+            with stage("state_store"):
+                # Rows that disappeared from the file leave the store too
+                removed = ~seen
+                if removed.any():
+                    dirty.update(stored_chem[removed])
+                    con.executemany("DELETE FROM samples WHERE dataset = ? AND sample_key = ?",
+                                    ((self.dataset, key) for key in stored_keys[removed]))
+                    totals -= _status_counts(stored_bits[removed])
+                    self.stats["removed"] = int(removed.sum())
+
+                self.summary.merge(self._rebuild_summary(con, added, {c for c in dirty if pd.notna(c)}, totals))
+                con.commit()
+        finally:
+            con.close()  # uncommitted changes (an interrupted run) are discarded
+
+    def _load_totals(self, con) -> np.ndarray:
+        row = con.execute("SELECT rows, pass_count, fail_count FROM datasets WHERE dataset = ?",
+                          (self.dataset,)).fetchone()
+        return np.array(row or (0, 0, 0), dtype=np.int64)
+
+    def _rebuild_summary(self, con, added: ComplianceSummary, dirty: set, totals) -> ComplianceSummary:
+        """Stored partials for untouched chemicals + new rows + dirty chemicals from the store; saved back."""
+        stored = con.execute("SELECT chemical, stats FROM partials WHERE dataset = ?", (self.dataset,)).fetchall()
+        partials = pd.DataFrame([json.loads(stats) for _, stats in stored],
+                                index=[chem for chem, _ in stored], columns=list(_SUMMARY_AGG))
+
+        summary = ComplianceSummary()
+        summary._fold(partials.drop(index=list(dirty), errors="ignore"))
+        summary._fold(added.table.drop(index=list(dirty), errors="ignore"))
+        value_cols = ", ".join(f"{name} AS \"{col}\"" for col, name in _STATE_VALUE_COLS.items())
+        for chem in sorted(dirty):
+            rows = pd.read_sql_query(
+                "SELECT chemical AS CHEMICAL, CASE WHEN fail_bits = 0 THEN 'COMPLIANT' "
+                "WHEN fail_bits > 0 THEN 'NON-COMPLIANT' ELSE 'UNKNOWN CHEMICAL' END AS STATUS, "
+                f"{value_cols} FROM samples WHERE dataset = ? AND chemical = ?", con, params=(self.dataset, chem))
+            if len(rows):
+                summary.update(rows)
+        summary.rows, summary.pass_count, summary.fail_count = (int(t) for t in totals)
+
+        con.execute("DELETE FROM partials WHERE dataset = ?", (self.dataset,))
+        con.executemany("INSERT INTO partials (dataset, chemical, stats) VALUES (?, ?, ?)",
+                        ((self.dataset, chem, json.dumps({k: float(v) for k, v in stats.items()}))
+                         for chem, stats in summary.table.iterrows()))
+        con.execute("INSERT OR REPLACE INTO datasets (dataset, rows, pass_count, fail_count, updated) "
+                    "VALUES (?, ?, ?, ?, ?)", (self.dataset, summary.rows, summary.pass_count,
+                                               summary.fail_count, datetime.now().isoformat(timespec="seconds")))
+        return summary
+
+# -------------------- Out-of-Core --------------------
+def partition_csv(csv_path, work_dir, partitions=OUT_OF_CORE_PARTITIONS, chunksize=CHUNK_SIZE, scoped=False):
+    """Split a CSV on disk by chemical; returns the paths of the non-empty partitions.
+
+    Every row of a chemical lands in the same partition file (a hash of its name,
+    modulo ``partitions``), in input order and with standardized headers (``scoped``
+    as in resolve_headers). Only one chunk is held in memory at a time.
+    """
+    paths = [os.path.join(work_dir, f"partition_{i:04d}.csv") for i in range(partitions)]
+    written = np.zeros(partitions, dtype=bool)
+    for chunk in iter_standardized_chunks(csv_path, chunksize, scoped):
+        with stage("partition", len(chunk)):
+            if "CHEMICAL" in chunk.columns:
+                names = chunk["CHEMICAL"].astype(str).to_numpy(dtype=object)
+                keys = pd.util.hash_array(names) % np.uint64(partitions)
+            else:
+                keys = np.zeros(len(chunk), dtype=np.uint64)
+            for key, part in chunk.groupby(keys, sort=False):
+                part.to_csv(paths[key], mode="a" if written[key] else "w", header=not written[key], index=False)
+                written[key] = True
+    return [path for path, used in zip(paths, written) if used]
+
+def iter_out_of_core_chunks(csv_path, ranges_df: pd.DataFrame, chunksize: int = CHUNK_SIZE,
+                            partitions=OUT_OF_CORE_PARTITIONS, work_dir=None):
+    """Checked chunks of a CSV too large for memory, one chemical partition at a time.
+
+    The input is first partitioned under a temporary directory in ``work_dir`` (default:
+    the system temp dir); each partition is then checked on its own and deleted once
+    streamed. Rows come out grouped by partition, in input order within each one.
+    """
+    limits = range_limits(ranges_df)
+    with tempfile.TemporaryDirectory(prefix="compliancemole_", dir=work_dir) as tmp:
+        for path in partition_csv(csv_path, tmp, partitions, chunksize, limits.rules is not None):
+            yield from iter_compliance_chunks(path, ranges_df, chunksize, limits)
+            os.remove(path)
 
 
+# -------------------- Main --------------------
+import sys
 
-    # Ensure Summary is the active sheet
-    wb.active = wb["Summary"]
-    
-    wb.save(save_path)
-    print(f"Final formatted report saved at: {save_path}")
+def process_csv(csv_path, save_path, user_info, ranges_df, options=ReportOptions(), *, state_path=None,
+                partitions=0, work_dir=None):
+    """Check one CSV against already-loaded ranges and write its report(s) as ``options`` say.
+
+    The workbook is streamed to disk (``options.write_only``) so memory stays bounded by
+    the chunk size; ``write_only=False`` builds it in memory instead, which grows with the input.
+    With ``state_path`` only new, changed or re-limited rows are checked (see IncrementalRun).
+    With ``partitions`` the input is processed out of core in that many chemical partitions
+    (see iter_out_of_core_chunks) and the workbook is always streamed.
+    With ``options.trend_window`` rolling trends are reported too, over
+    ``options.trend_history`` if given (see TrendTracker).
+    """
+    trends = None
+    if options.trend_window:
+        trends = TrendTracker(range_limits(ranges_df), options.trend_window, options.trend_history).start(csv_path)
+    chunksize = options.chunksize
+    if partitions:
+        if state_path:
+            raise ValueError("out-of-core processing cannot be combined with incremental state")
+        return write_outputs(iter_out_of_core_chunks(csv_path, ranges_df, chunksize, partitions, work_dir),
+                             save_path, user_info, options._replace(write_only=True), trends=trends)
+    if not state_path:
+        return write_outputs(iter_compliance_chunks(csv_path, ranges_df, chunksize), save_path, user_info, options,
+                             trends=trends)
+    run = IncrementalRun(state_path, os.path.abspath(csv_path))
+    summary = write_outputs(run.chunks(csv_path, ranges_df, chunksize), save_path, user_info, options,
+                            summary=run.summary, trends=trends)
+    stats = run.stats
+    print(f"Incremental: checked {stats['checked']} of {stats['rows']} rows "
+          f"({stats['new']} new, {stats['changed']} changed or re-limited, {stats['removed']} removed)")
+    return summary
+
+# -------------------- Batch Processing --------------------
+_worker_ranges = None  # ranges table handed to each pool worker once, at startup
+
+def _init_batch_worker(ranges_df):
+    global _worker_ranges
+    _worker_ranges = ranges_df
+
+def _batch_job(csv_path, save_path, user_info, options, ranges_df=None, **kwargs):
+    """Process one batch file and describe the outcome (with per-stage timings) instead of raising.
+
+    ``options`` and ``kwargs`` go to process_csv; ``ranges_df`` defaults to the
+    table handed to this pool worker.
+    """
+    start = time.perf_counter()
+    outcome = {"input": csv_path, "output": save_path,
+               "outputs": [p for group in output_paths(save_path, options.formats,
+                                                       bool(options.trend_window)).values() for p in group]}
+    report = RunReport()
+    try:
+        with instrumented(report):
+            ranges_df = _worker_ranges if ranges_df is None else ranges_df
+            headers = resolve_headers(pd.read_csv(csv_path, nrows=0).columns, is_scoped(ranges_df))
+            outcome["headers"] = {"unmatched": headers.unmatched, "ambiguous": headers.ambiguous,
+                                  "missing": headers.missing}
+            summary = process_csv(csv_path, save_path, user_info, ranges_df, options, **kwargs)
+        outcome.update(status="ok", rows=summary.rows)
+    except Exception as e:
+        outcome.update(status="error", error=f"{type(e).__name__}: {e}")
+    outcome["seconds"] = round(time.perf_counter() - start, 3)
+    outcome["stages"] = report.stage_list()
+    return outcome
+
+def run_batch(csv_paths, output_dir, user_info, ranges_df, options=ReportOptions(), *, workers=1, state_path=None,
+              partitions=0, work_dir=None):
+    """Write one report per CSV, spread over a process pool, and return the outcome manifest.
+
+    Report names are reserved up front so parallel files never race for the same
+    version. A failing file is recorded in the manifest and the batch carries on.
+    ``options`` and the remaining keywords are process_csv's.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    save_paths = []
+    for _ in csv_paths:
+        save_paths.append(next_save_path(output_dir, user_info, taken=save_paths, formats=options.formats))
+    kwargs = dict(state_path=state_path, partitions=partitions, work_dir=work_dir)
+    jobs = [(csv_path, save_path, user_info, options) for csv_path, save_path in zip(csv_paths, save_paths)]
+
+    start = time.perf_counter()
+    if workers <= 1 or len(jobs) == 1:
+        files = [_batch_job(*job, ranges_df, **kwargs) for job in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker, initargs=(ranges_df,)) as pool:
+            futures = [pool.submit(_batch_job, *job, **kwargs) for job in jobs]
+            files = []
+            for job, future in zip(jobs, futures):
+                try:
+                    files.append(future.result())
+                except Exception as e:  # worker process died
+                    files.append({"input": job[0], "output": job[1], "status": "error",
+                                  "error": f"{type(e).__name__}: {e}", "seconds": None})
+
+    return _save_manifest(output_dir, files, start, workers=workers)
+
+def _save_manifest(output_dir, files, start, **details):
+    """Write batch_manifest.json for a finished batch and return it."""
+    manifest = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        **details,
+        "seconds": round(time.perf_counter() - start, 3),
+        "succeeded": sum(f["status"] == "ok" for f in files),
+        "failed": sum(f["status"] != "ok" for f in files),
+        "files": files,
+    }
+    with open(os.path.join(output_dir, "batch_manifest.json"), "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    return manifest
+
+# -------------------- Async Pipeline --------------------
+PIPELINE_QUEUE_SIZE = 4  # chunks buffered between two stages before the producer waits
+PIPELINE_SAMPLE_INTERVAL = 0.05  # seconds between queue-depth samples
+
+class MeteredQueue:
+    """Bounded asyncio queue between two pipeline stages, with depth and wait metrics."""
+
+    def __init__(self, name, maxsize=PIPELINE_QUEUE_SIZE):
+        import asyncio
+
+        self.name = name
+        self.queue = asyncio.Queue(maxsize)
+        self.items = 0
+        self.max_depth = 0
+        self.put_wait = 0.0  # producer blocked on a full queue (backpressure)
+        self.get_wait = 0.0  # consumer idle on an empty queue
+        self._depth_sum = 0
+        self._samples = 0
+
+    async def put(self, item):
+        start = time.perf_counter()
+        await self.queue.put(item)
+        self.put_wait += time.perf_counter() - start
+        self.items += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def get(self):
+        start = time.perf_counter()
+        item = await self.queue.get()
+        self.get_wait += time.perf_counter() - start
+        return item
+
+    def sample(self):
+        self._depth_sum += self.queue.qsize()
+        self._samples += 1
+
+    def metrics(self):
+        return {
+            "queue": self.name,
+            "maxsize": self.queue.maxsize,
+            "items": self.items,
+            "max_depth": self.max_depth,
+            "mean_depth": round(self._depth_sum / self._samples, 2) if self._samples else None,
+            "producer_blocked_seconds": round(self.put_wait, 4),
+            "consumer_idle_seconds": round(self.get_wait, 4),
+        }
+
+async def run_pipeline(jobs, ranges_df, user_info, options=ReportOptions(), *, queue_size=PIPELINE_QUEUE_SIZE):
+    """Check and write several CSVs with the stages overlapped; returns (file outcomes, queue metrics).
+
+    ``jobs`` is a list of (csv_path, save_path). Reading, header standardization,
+    compliance checking and report writing each run on their own executor thread,
+    linked by bounded queues of ``queue_size`` chunks, so the next file is parsed
+    and checked while the previous one is still being written. Chunks and files
+    keep their order; a failing file is recorded and the rest carry on.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    limits = range_limits(ranges_df)
+    read_q, std_q, check_q = queues = [MeteredQueue(name, queue_size) for name in ("read", "standardize", "check")]
+    done = object()  # marks the end of one file's chunks
+    standardizers = {}  # file index -> _standardizer
+    outcomes = [{"input": csv_path, "output": save_path, "status": "ok",
+                 "outputs": [p for group in output_paths(save_path, options.formats,
+                                                         bool(options.trend_window)).values() for p in group]}
+                for csv_path, save_path in jobs]
+    executors = {name: ThreadPoolExecutor(1, thread_name_prefix=f"pipeline-{name}")
+                 for name in ("read", "standardize", "check", "write")}
+
+    def fail(i, e):
+        outcomes[i].update(status="error", error=f"{type(e).__name__}: {e}")
+
+    async def read():
+        for i, (csv_path, _) in enumerate(jobs):
+            chunks = _read_csv_chunks(csv_path, options.chunksize)
+            try:
+                while (chunk := await loop.run_in_executor(executors["read"], next, chunks, None)) is not None:
+                    await read_q.put((i, chunk))
+            except Exception as e:
+                await read_q.put((i, e))  # errors travel downstream in place of a chunk
+            finally:
+                chunks.close()
+            await read_q.put((i, done))
+        await read_q.put(None)
+
+    def standardize(i, chunk):
+        if i not in standardizers:
+            standardizers[i] = _standardizer(limits.rules is not None, compact=True)
+        return standardizers[i](chunk)
+
+    def check(i, chunk):
+        with stage("check_compliance", len(chunk)):
+            return check_compliance(chunk, ranges_df, limits)
+
+    async def transform(name, fn, source, target):
+        while (item := await source.get()) is not None:
+            i, chunk = item
+            if isinstance(chunk, pd.DataFrame):
+                try:
+                    chunk = await loop.run_in_executor(executors[name], fn, i, chunk)
+                except Exception as e:
+                    chunk = e
+            await target.put((i, chunk))
+        await target.put(None)
+
+    async def write():
+        item = await check_q.get()
+        while item is not None:
+            i, _ = item
+            current = [item]
+
+            def chunks():
+                # Runs on the write thread; pulls the rest of file i from the event loop
+                while True:
+                    _, chunk = current[0]
+                    if chunk is done:
+                        return
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    yield chunk
+                    with stage("write_wait"):
+                        current[0] = asyncio.run_coroutine_threadsafe(check_q.get(), loop).result()
+
+            def write_file():
+                trends = None
+                if options.trend_window:  # the write stage takes files in order, so the history stays sequential
+                    trends = TrendTracker(limits, options.trend_window, options.trend_history).start(jobs[i][0])
+                return write_outputs(chunks(), jobs[i][1], user_info, options, trends=trends)
 
+            try:
+                summary = await loop.run_in_executor(executors["write"], write_file)
+                outcomes[i]["rows"] = summary.rows
+            except Exception as e:
+                fail(i, e)
+            while current[0][1] is not done:  # drop what is left of a failed file
+                current[0] = await check_q.get()
+            item = await check_q.get()
+
+    async def sample_depths():
+        while True:
+            for q in queues:
+                q.sample()
+            await asyncio.sleep(PIPELINE_SAMPLE_INTERVAL)
+
+    sampler = asyncio.ensure_future(sample_depths())
+    try:
+        await asyncio.gather(read(), transform("standardize", standardize, read_q, std_q),
+                             transform("check", check, std_q, check_q), write())
+    finally:
+        sampler.cancel()
+        for executor in executors.values():
+            executor.shutdown(wait=False)
+    return outcomes, [q.metrics() for q in queues]
+
+def run_async_batch(csv_paths, output_dir, user_info, ranges_df, options=ReportOptions(), *,
+                    queue_size=PIPELINE_QUEUE_SIZE):
+    """run_batch through the overlapped async pipeline (one process); the manifest adds queue metrics."""
+    import asyncio
+
+    os.makedirs(output_dir, exist_ok=True)
+    save_paths = []
+    for _ in csv_paths:
+        save_paths.append(next_save_path(output_dir, user_info, taken=save_paths, formats=options.formats))
+    start = time.perf_counter()
+    files, queues = asyncio.run(run_pipeline(list(zip(csv_paths, save_paths)), ranges_df, user_info, options,
+                                             queue_size=queue_size))
+    return _save_manifest(output_dir, files, start, pipeline={"queue_size": queue_size, "queues": queues})
+
+def report_options(args) -> ReportOptions:
+    """The ReportOptions of a command line, read once from ``args``."""
+    return ReportOptions(chunksize=args.chunksize, write_only=args.write_only, formats=args.formats,
+                         chart=args.chart, shard_rows=args.shard_rows, shard_mode=args.shard_mode,
+                         trend_window=args.trends, trend_history=args.trend_history,
+                         score_formula=args.score_formula)
+
+def run_headless(args, report=None):
+    """Batch mode: process every input CSV with no dialogs, reusing one ranges table."""
+    csv_paths = collect_csv_paths(args.inputs)
+    if not csv_paths:
+        print("No CSV files found. Exiting.")
+        return
+    user_info = make_user_info(args.first_name, args.middle_name, args.last_name, args.company, args.date)
+    with stage("load_ranges"):
+        ranges_df = load_ranges(args.ranges)
+    if args.async_pipeline:
+        print(f"Processing {len(csv_paths)} file(s) through the async pipeline (queue size {args.queue_size})")
+        manifest = run_async_batch(csv_paths, args.output_dir, user_info, ranges_df, report_options(args),
+                                   queue_size=args.queue_size)
+        if report is not None:
+            # Stages ran on the pipeline threads under this report already
+            report.info.update(inputs=csv_paths, rows=sum(f.get("rows") or 0 for f in manifest["files"]),
+                               pipeline=manifest["pipeline"], succeeded=manifest["succeeded"],
+                               failed=manifest["failed"])
+    else:
+        print(f"Processing {len(csv_paths)} file(s) with {args.workers} worker(s)")
+        manifest = run_batch(csv_paths, args.output_dir, user_info, ranges_df, report_options(args),
+                             workers=args.workers, state_path=args.state, partitions=args.out_of_core,
+                             work_dir=args.work_dir)
+    if report is not None and not args.async_pipeline:
+        # Worker stages ran in their own reports (possibly other processes); fold them in
+        for f in manifest["files"]:
+            report.merge(f.get("stages", ()))
+        report.info.update(inputs=csv_paths, rows=sum(f.get("rows") or 0 for f in manifest["files"]),
+                           workers=args.workers, succeeded=manifest["succeeded"], failed=manifest["failed"])
+    for f in manifest["files"]:
+        if f["status"] != "ok":
+            print(f"FAILED {f['input']}: {f['error']}")
+    print(f"{manifest['succeeded']} succeeded, {manifest['failed']} failed in {manifest['seconds']}s")
+    if manifest["failed"]:
+        sys.exit(1)
+
+# -------------------- Service --------------------
+SERVICE_ADDRESS = "127.0.0.1:8765"  # "HOST:PORT", or "unix:/path/to.sock"
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+class ComplianceService:
+    """Warm ranges plus the check and report calls behind the HTTP API; shared by all request threads.
+
+    The ranges workbook is re-validated on every request (one stat while unchanged) and
+    recompiled as soon as it changes; a workbook that fails to load keeps the last good ranges.
+    """
+
+    def __init__(self, ranges_path=RANGES_PATH, chart="image"):
+        self.ranges_path, self.chart = ranges_path, chart
+        self._lock = threading.Lock()
+        self.ranges = _load_compiled_ranges(ranges_path)
+        self.loaded = datetime.now().isoformat(timespec="seconds")
+        self.reloads = 0
+        self.requests = 0
+        self._failed = None  # (mtime_ns, size) of a workbook version that would not load
+
+    def current(self):
+        """(ranges_df, limits), reloaded first if the workbook changed on disk."""
+        try:
+            stat = os.stat(self.ranges_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version is not None and version == self._failed:
+            return self.ranges  # same broken file as last time; don't re-parse it per request
+        try:
+            ranges = _load_compiled_ranges(self.ranges_path)  # in-process memo while unchanged
+        except Exception as e:
+            if version != self._failed or version is None:
+                print(f"Ranges reload failed, keeping the previous ranges: {type(e).__name__}: {e}")
+            self._failed = version
+            return self.ranges
+        with self._lock:
+            if ranges is not self.ranges:
+                self.ranges = ranges
+                self.loaded = datetime.now().isoformat(timespec="seconds")
+                self.reloads += 1
+                print(f"Ranges reloaded from {self.ranges_path} ({len(ranges[1].chemicals)} chemicals)")
+        return ranges
+
+    def check(self, df: pd.DataFrame) -> pd.DataFrame:
+        ranges_df, limits = self.current()
+        with self._lock:
+            self.requests += 1
+        # No compact_frame: request batches are small, so the conversion would only add latency
+        return check_compliance(standardize_csv_headers(df, limits.rules is not None), ranges_df, limits)
+
+    def report(self, df: pd.DataFrame, user_info, chart=None) -> bytes:
+        """Formatted XLSX report of a sample batch, as bytes."""
+        checked = self.check(df)
+        with tempfile.TemporaryDirectory(prefix="compliancemole_") as tmp:
+            path = os.path.join(tmp, "report.xlsx")
+            format_excel(checked, path, user_info, ReportOptions(write_only=False, chart=chart or self.chart),
+                         announce=False)
+            with open(path, "rb") as fh:
+                return fh.read()
+
+    def health(self) -> dict:
+        ranges_df, limits = self.current()
+        return {"status": "ok", "ranges": os.path.abspath(self.ranges_path), "chemicals": len(limits.chemicals),
+                "loaded": self.loaded, "reloads": self.reloads, "requests": self.requests}
+
+    def warm_up(self):
+        """Run one tiny batch through check and report so imports and caches are hot."""
+        sample = pd.DataFrame([["WARMUP", self.ranges[1].chemicals[0] if len(self.ranges[1].chemicals) else "",
+                                0, 7, 20, 100, 1]], columns=CANONICAL_REPORT_HEADERS[:7])
+        self.report(sample, make_user_info("Warm", "", "Up", "Service"))
+        self.requests = 0
+
+def _read_samples(body: bytes, content_type: str) -> pd.DataFrame:
+    """Sample batch from a request body: CSV, or JSON records (a list, or {"samples": [...]})."""
+    if "json" in content_type:
+        records = json.loads(body or b"[]")
+        return pd.DataFrame(records["samples"] if isinstance(records, dict) else records)
+    return pd.read_csv(io.BytesIO(body))
+
+def _service_handler(service: ComplianceService):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import urlsplit, parse_qs
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so a client pays the connect once
+        disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+        def setup(self):
+            if not isinstance(self.client_address, tuple):
+                self.disable_nagle_algorithm = False  # Unix socket: no TCP options
+            super().setup()
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+        def _send(self, code, body: bytes, content_type="application/json", started=None):
+            self.send_response(code)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if started is not None:
+                self.send_header("X-Elapsed-Ms", f"{(time.perf_counter() - started) * 1000:.2f}")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_json(self, code, payload, started=None):
+            self._send(code, json.dumps(payload).encode(), started=started)
+
+        def do_GET(self):
+            if urlsplit(self.path).path == "/health":
+                self._send_json(200, service.health())
+            else:
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self):
+            started = time.perf_counter()
+            url = urlsplit(self.path)
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                if url.path == "/check":
+                    checked = service.check(_read_samples(body, self.headers.get("Content-Type", "")))
+                    cols = [c for c in ("SAMPLE ID", "CHEMICAL", "STATUS", "COMMENT") if c in checked.columns]
+                    status = checked["STATUS"]
+                    results = checked[cols].to_json(orient="records")
+                    payload = (f'{{"rows": {len(checked)}, "pass": {int((status == "COMPLIANT").sum())}, '
+                               f'"fail": {int((status == "NON-COMPLIANT").sum())}, '
+                               f'"ms": {(time.perf_counter() - started) * 1000:.2f}, "results": {results}}}')
+                    self._send(200, payload.encode(), started=started)
+                elif url.path == "/report":
+                    q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    user_info = make_user_info(q.get("first", ""), q.get("middle", ""), q.get("last", ""),
+                                               q.get("company", ""), q.get("date"))
+                    data = service.report(_read_samples(body, self.headers.get("Content-Type", "")), user_info,
+                                          q.get("chart"))
+                    self._send(200, data, XLSX_CONTENT_TYPE, started)
+                else:
+                    self._send_json(404, {"error": f"unknown path {self.path}"})
+            except Exception as e:
+                self._send_json(400, {"error": f"{type(e).__name__}: {e}"}, started)
+
+    return Handler
+
+def serve(address=SERVICE_ADDRESS, ranges_path=RANGES_PATH, chart="image"):
+    """Run the compliance service until interrupted.
+
+    GET /health; POST /check with a CSV or JSON sample batch returns STATUS/COMMENT per
+    row as JSON; POST /report?first=&last=&company=&date=&chart= returns the XLSX report.
+    """
+    import signal
+    import socketserver
+    from http.server import ThreadingHTTPServer
+
+    service = ComplianceService(ranges_path, chart)
+    service.warm_up()
+    handler = _service_handler(service)
+    if address.startswith("unix:"):
+        sock_path = address[len("unix:"):]
+        if os.path.exists(sock_path):
+            os.remove(sock_path)  # stale socket from an earlier run
+
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        server = UnixHTTPServer(sock_path, handler)
+    else:
+        host, port = address.rsplit(":", 1)
+        server = ThreadingHTTPServer((host, int(port)), handler)
+    print(f"Compliance service listening on {address} (ranges: {ranges_path}); Ctrl+C to stop")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # clean shutdown (socket file removed) on kill
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if address.startswith("unix:") and os.path.exists(address[len("unix:"):]):
+            os.remove(address[len("unix:"):])
+
+def service_connection(address=SERVICE_ADDRESS):
+    """http.client connection to a running service ("HOST:PORT", "http://HOST:PORT" or "unix:PATH")."""
+    import http.client
+    import socket
+
+    if address.startswith("unix:"):
+        class UnixHTTPConnection(http.client.HTTPConnection):
+            def connect(self):
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.connect(address[len("unix:"):])
+
+        return UnixHTTPConnection("localhost")
+    host, port = address.split("://")[-1].rsplit(":", 1)
+    return http.client.HTTPConnection(host, int(port))
+
+def submit_to_service(address, csv_paths, report_dir=None, user_info=None):
+    """Test client: post each CSV to /check (and /report with ``report_dir``), printing results and latency."""
+    from urllib.parse import urlencode
+
+    conn = service_connection(address)
+    for csv_path in csv_paths:
+        with open(csv_path, "rb") as fh:
+            body = fh.read()
+        start = time.perf_counter()
+        conn.request("POST", "/check", body, {"Content-Type": "text/csv"})
+        response = conn.getresponse()
+        payload = json.loads(response.read())
+        ms = (time.perf_counter() - start) * 1000
+        if response.status != 200:
+            print(f"{csv_path}: HTTP {response.status} {payload.get('error')}")
+            continue
+        print(f"{csv_path}: {payload['rows']} rows, {payload['pass']} pass, {payload['fail']} fail "
+              f"in {ms:.1f} ms (server {payload['ms']:.1f} ms)")
+        if report_dir:
+            info = user_info or make_user_info("", "", "", "")
+            query = urlencode({"first": info["FirstName"], "middle": info["MiddleName"], "last": info["LastName"],
+                               "company": info["CompanyName"], "date": info["DateToday"]})
+            conn.request("POST", f"/report?{query}", body, {"Content-Type": "text/csv"})
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 200:
+                print(f"{csv_path}: report failed, HTTP {response.status} {data[:200]!r}")
+                continue
+            os.makedirs(report_dir, exist_ok=True)
+            out = os.path.join(report_dir, os.path.splitext(os.path.basename(csv_path))[0] + ".xlsx")
+            with open(out, "wb") as fh:
+                fh.write(data)
+            print(f"{csv_path}: report saved at {out}")
+    conn.close()
+
+# -------------------- Benchmarks --------------------
+def startup_benchmark(repeats=5, top=10):
+    """Time a cold import of this script in fresh interpreters.
+
+    Returns median/min import seconds plus the slowest direct imports reported by
+    ``python -X importtime`` (median milliseconds across runs).
+    """
+    import statistics
+    import subprocess
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    seconds, imports = [], {}
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                              cwd=script_dir, capture_output=True, text=True, check=True)
+        seconds.append(float(proc.stdout.split()[-1]))
+        lines = proc.stderr.splitlines()
+        # Interpreter startup imports end with "site"; only count what follows
+        start = next((i + 1 for i, line in enumerate(lines) if line.endswith("| site")), 0)
+        for line in lines[start:]:
+            # "import time: self [us] | cumulative | <2 spaces per nesting level>name"
+            parts = line.split("|")
+            if len(parts) == 3 and parts[2].startswith("   ") and not parts[2].startswith("    "):
+                imports.setdefault(parts[2].strip(), []).append(int(parts[1]) / 1000)
+    slowest = sorted(((name, round(statistics.median(ms), 1)) for name, ms in imports.items()),
+                     key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "python": sys.version.split()[0],
+        "runs": repeats,
+        "median_seconds": round(statistics.median(seconds), 4),
+        "min_seconds": round(min(seconds), 4),
+        "slowest_imports_ms": dict(slowest),
+    }
 
+# Plausible (low, high) span per check for synthetic limits, in COMPLIANCE_CHECKS order
+SYNTHETIC_SPANS = [(0.0, 500.0), (0.0, 14.0), (-10.0, 120.0), (80.0, 400.0), (0.5, 50.0)]
+BENCHMARK_SIZES = (1_000, 100_000, 1_000_000)
+BENCHMARK_STAGES = ("read_csv", "standardize_csv_headers", "load_ranges", "check_compliance",
+                    "format_excel", "add_pass_fail_chart", "run_batch")
+BENCHMARK_WORKERS = (1, 2, 4)
+BENCHMARK_BATCH_FILES = 4  # copies of the synthetic CSV in the run_batch stage
+
+def make_synthetic_data(out_dir, rows, chemicals=25, noncompliance_rate=0.1, seed=0):
+    """Write a seeded sample CSV and its matching ranges workbook; returns (csv_path, ranges_path).
+
+    Sample headers are drawn from the CSV_HEADER_ALIASES variants (random alias, case and
+    separators). Each non-compliant row has one measurement pushed outside its limits.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"CHEM-{i:04d}" for i in range(chemicals)], dtype=object)
+
+    # Limits on a 0.1 grid, so in-range values rounded to 0.01 stay in range
+    mins = np.empty((chemicals, len(COMPLIANCE_CHECKS)))
+    maxs = np.empty_like(mins)
+    for j, (low, high) in enumerate(SYNTHETIC_SPANS):
+        width = high - low
+        mins[:, j] = np.round(rng.uniform(low, low + 0.4 * width, chemicals), 1)
+        maxs[:, j] = np.round(mins[:, j] + rng.uniform(0.2 * width, 0.5 * width, chemicals), 1)
+    ranges = pd.DataFrame({"Chemical": names})
+    for j, (_, prefix) in enumerate(COMPLIANCE_CHECKS):
+        ranges[f"{prefix}_Min"], ranges[f"{prefix}_Max"] = mins[:, j], maxs[:, j]
+
+    codes = rng.integers(0, chemicals, rows)
+    lo, hi = mins[codes], maxs[codes]
+    values = np.round(rng.uniform(lo, hi), 2)
+    bad = rng.random(rows) < noncompliance_rate
+    check = rng.integers(0, len(COMPLIANCE_CHECKS), rows)[bad]
+    bad_rows = np.flatnonzero(bad)
+    span = (hi - lo)[bad_rows, check]
+    above = rng.random(len(bad_rows)) < 0.5
+    offset = np.round(span * rng.uniform(0.05, 0.5, len(bad_rows)), 2)
+    values[bad_rows, check] = np.where(above, hi[bad_rows, check] + offset, lo[bad_rows, check] - offset)
+
+    decorate = [str, str.upper, lambda a: a.replace("_", " ").title(), lambda a: a.replace("_", "-")]
+    headers = []
+    for aliases in CSV_HEADER_ALIASES:
+        options = aliases.split("|")
+        headers.append(decorate[rng.integers(len(decorate))](options[rng.integers(len(options))]))
+    samples = pd.DataFrame({headers[0]: [f"S{i:08d}" for i in range(rows)], headers[1]: names[codes]})
+    for j, header in enumerate(headers[2:]):
+        samples[header] = values[:, j]
+
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, f"synthetic_{rows}.csv")
+    ranges_path = os.path.join(out_dir, f"synthetic_ranges_{chemicals}.xlsx")
+    samples.to_csv(csv_path, index=False)
+    ranges.to_excel(ranges_path, index=False)
+    return csv_path, ranges_path
+
+class StageMeter:
+    """Times a block and tracks its peak RSS by sampling on a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.seconds = None
+        self.peak_rss = None
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            rss = _current_rss()
+            if rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def __enter__(self):
+        self.peak_rss = _current_rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start
+        self._done.set()
+        self._thread.join()
+        rss = _current_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+        return False
+
+    def record(self, stage, rows):
+        """JSON-ready stage entry."""
+        return {
+            "stage": stage,
+            "rows": rows,
+            "seconds": round(self.seconds, 4),
+            "rows_per_second": round(rows / self.seconds) if self.seconds else None,
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1) if self.peak_rss else None,
+        }
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, chemicals=25, noncompliance_rate=0.1, seed=0,
+                   skip=(), work_dir=None, out_path=None, workers=BENCHMARK_WORKERS):
+    """Time each pipeline stage on synthetic data of every size; returns (and saves) the results.
+
+    The run_batch stage times a batch of BENCHMARK_BATCH_FILES copies of the CSV once
+    per count in ``workers``, with its speedup over the first count.
+    """
+    with open(os.path.abspath(__file__), "rb") as fh:
+        script_sha1 = hashlib.sha1(fh.read()).hexdigest()
+    results = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "script_sha1": script_sha1,
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__, "numpy": np.__version__, "openpyxl": openpyxl.__version__,
+        "seed": seed, "chemicals": chemicals, "noncompliance_rate": noncompliance_rate,
+        "cpus": os.cpu_count(),
+        "runs": [],
+    }
+    user_info = make_user_info("Bench", "", "Mark", "Synthetic", "20000101")
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        for rows in sizes:
+            csv_path, ranges_path = make_synthetic_data(tmp, rows, chemicals, noncompliance_rate, seed)
+            stages, df, ranges_df = [], None, None
+            for name in BENCHMARK_STAGES:
+                if name in skip or name == "run_batch":
+                    continue
+                with StageMeter() as meter:
+                    if name == "read_csv":
+                        df = pd.read_csv(csv_path)
+                    elif name == "standardize_csv_headers":
+                        df = standardize_csv_headers(pd.read_csv(csv_path) if df is None else df)
+                    elif name == "load_ranges":
+                        ranges_df = load_ranges(ranges_path, use_cache=False)
+                    elif name == "check_compliance":
+                        df = check_compliance(df, ranges_df)
+                    elif name == "format_excel":
+                        # As shipped (streamed), minus the chart, which is timed on its own below
+                        format_excel(df, os.path.join(tmp, f"report_{rows}.xlsx"), user_info,
+                                     ReportOptions(chart="none"))
+                    elif name == "add_pass_fail_chart":
+                        _pass_fail_png.cache_clear()
+                        passed = int((df["STATUS"] == "COMPLIANT").sum())
+                        add_pass_fail_chart(openpyxl.Workbook().active, passed, len(df) - passed,
+                                            cache_dir=os.path.join(tmp, "charts"))
+                stages.append(meter.record(name, rows))
+                print(f"{rows:>10,} rows  {name:<24} {stages[-1]['seconds']:>9.3f}s")
+            if "run_batch" not in skip and workers:
+                batch_dir = os.path.join(tmp, f"batch_{rows}")
+                os.makedirs(batch_dir)
+                paths = [os.path.join(batch_dir, f"part_{i}.csv") for i in range(BENCHMARK_BATCH_FILES)]
+                for path in paths:
+                    shutil.copyfile(csv_path, path)
+                batch_ranges = load_ranges(ranges_path, use_cache=False)
+                first = None  # seconds with the first worker count, the speedup baseline
+                for count in workers:
+                    # The chart has its own stage; the reports' "saved at" lines are dropped
+                    with StageMeter() as meter, redirect_stdout(io.StringIO()):
+                        manifest = run_batch(paths, os.path.join(batch_dir, f"out_{count}"), user_info,
+                                             batch_ranges, ReportOptions(chart="none"), workers=count)
+                    if manifest["failed"]:
+                        raise RuntimeError(f"run_batch benchmark failed: {manifest['files']}")
+                    entry = meter.record("run_batch", rows * len(paths))
+                    first = first or entry["seconds"]
+                    entry.update(workers=count, files=len(paths), speedup=round(first / entry["seconds"], 2))
+                    stages.append(entry)
+                    print(f"{rows:>10,} rows  {f'run_batch, {count} worker(s)':<24} {entry['seconds']:>9.3f}s"
+                          f"  (x{entry['speedup']:.2f})")
+            results["runs"].append({"rows": rows, "stages": stages})
+            del df, ranges_df
+
+    if out_path:
+        with open(out_path, "w") as fh:
+            json.dump(results, fh, indent=2)
+    return results
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Check chemical sample CSVs against compliance ranges and write Excel reports. "
+                    "Pass --output-dir to run headless (no dialogs)."
+    )
+    parser.add_argument("inputs", nargs="*", help="CSV files or directories of CSVs")
+    parser.add_argument("--ranges", default=RANGES_PATH,
+                        help="Compliant ranges workbook (default: $COMPLIANCEMOLE_RANGES or CompliantRanges.xlsx beside this script)")
+    parser.add_argument("--output-dir", help="Write reports here without prompting")
+    parser.add_argument("--first-name", default="")
+    parser.add_argument("--middle-name", default="")
+    parser.add_argument("--last-name", default="")
+    parser.add_argument("--company", default="")
+    parser.add_argument("--date", help="Report date as YYYYMMDD (default: today)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE, help="Rows per streamed CSV chunk")
+    parser.add_argument("--workers", type=int, default=1, help="Parallel report processes for --output-dir runs")
+    parser.add_argument("--write-only", action=argparse.BooleanOptionalAction, default=True,
+                        help="Stream the Sample Data sheet to disk, so memory stays flat however large the input "
+                             "(the default; column widths are sized from the first chunk). --no-write-only builds "
+                             "the whole workbook in memory before saving; memory grows with the input")
+    parser.add_argument("--in-memory", dest="write_only", action="store_false", help="Same as --no-write-only")
+    parser.add_argument("--format", dest="formats", action="append", choices=OUTPUT_FORMATS,
+                        help="Output format; repeat for several (default: xlsx). csv/jsonl/parquet write the "
+                             "checked rows plus a _summary file; parquet needs pyarrow. rollup writes a mergeable "
+                             f"{ROLLUP_SUFFIX} summary for --consolidate")
+    parser.add_argument("--chart", choices=CHART_MODES, default="image",
+                        help="Summary pie chart: native Excel chart, matplotlib image (default), or none")
+    parser.add_argument("--score-formula", action="store_true",
+                        help="Write the Summary score as a live SUMPRODUCT formula instead of a precomputed value")
+    parser.add_argument("--state", metavar="DB",
+                        help="SQLite state store for incremental runs: only new, changed or re-limited rows are checked")
+    parser.add_argument("--out-of-core", type=int, nargs="?", const=OUT_OF_CORE_PARTITIONS, default=0,
+                        metavar="PARTITIONS",
+                        help="For inputs larger than memory: split each CSV on disk into chemical partitions "
+                             f"(default {OUT_OF_CORE_PARTITIONS}) and check them one at a time; implies --write-only")
+    parser.add_argument("--work-dir", help="Where --out-of-core keeps its partition files (default: system temp dir)")
+    parser.add_argument("--shard-rows", type=int, default=EXCEL_MAX_ROWS - 2, metavar="ROWS",
+                        help=f"Sample Data rows per sheet or workbook before starting the next (default and maximum "
+                             f"{EXCEL_MAX_ROWS - 2:,}, Excel's limit)")
+    parser.add_argument("--shard-mode", choices=SHARD_MODES, default="sheets",
+                        help="Where Sample Data continues past --shard-rows: more sheets in the report (default) "
+                             "or separate <report>_partN.xlsx workbooks")
+    parser.add_argument("--trends", type=int, nargs="?", const=TREND_WINDOW, default=0, metavar="WINDOW",
+                        help=f"Report rolling trends per chemical and measurement over the last WINDOW samples "
+                             f"(default {TREND_WINDOW}): moving mean/std, headroom to the limits and drift toward them")
+    parser.add_argument("--trend-history", metavar="PATH",
+                        help="Carry the trend windows across runs in this file (implies --trends); "
+                             "a file already folded in is not counted again")
+    parser.add_argument("--async-pipeline", action="store_true",
+                        help="For --output-dir runs: overlap reading, checking and writing across files in one "
+                             "process, with bounded queues between the stages (queue metrics go in the manifest)")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, metavar="CHUNKS",
+                        help=f"Chunks buffered between --async-pipeline stages before the producer waits "
+                             f"(default {PIPELINE_QUEUE_SIZE})")
+
+    parser.add_argument("--run-report", metavar="PATH",
+                        help="Write a JSON run report: wall time, rows, rows/s and peak memory per pipeline stage")
+    parser.add_argument("--profile", action="append", choices=PROFILE_KINDS, default=[],
+                        help="Profile the run: cpu (cProfile .pstats) and/or memory (tracemalloc top allocations)")
+    parser.add_argument("--profile-dir", default=".", help="Where --profile dumps go (default: current directory)")
+
+    parser.add_argument("--consolidate", metavar="XLSX",
+                        help=f"Merge the *{ROLLUP_SUFFIX} summaries given as inputs (files or directories) into one "
+                             "Summary workbook at XLSX and exit; needs --first-name, --last-name and --company")
+
+    service = parser.add_argument_group("service")
+    service.add_argument("--serve", nargs="?", const=SERVICE_ADDRESS, metavar="ADDRESS",
+                         help=f"Run the resident check service on HOST:PORT or unix:PATH (default {SERVICE_ADDRESS}) "
+                              "with warm, hot-reloaded ranges")
+    service.add_argument("--submit", metavar="ADDRESS",
+                         help="Test client: post the input CSVs to a running service and print results and latency")
+    service.add_argument("--submit-reports", metavar="DIR", help="With --submit, also fetch each XLSX report into DIR")
+
+    bench = parser.add_argument_group("benchmarks")
+    bench.add_argument("--startup-benchmark", type=int, nargs="?", const=5, metavar="RUNS",
+                       help="Print cold-import timings as JSON (default 5 runs) and exit")
+    bench.add_argument("--benchmark", nargs="?", const=",".join(map(str, BENCHMARK_SIZES)), metavar="SIZES",
+                       help="Time each pipeline stage on synthetic data of these comma-separated row counts "
+                            "(default 1000,100000,1000000) and exit")
+    bench.add_argument("--benchmark-out", default="benchmark_results.json", help="Where to save benchmark JSON")
+    bench.add_argument("--benchmark-chemicals", type=int, default=25, help="Distinct chemicals in synthetic data")
+    bench.add_argument("--benchmark-noncompliance", type=float, default=0.1,
+                       help="Fraction of synthetic rows with one value out of range")
+    bench.add_argument("--benchmark-seed", type=int, default=0)
+    bench.add_argument("--benchmark-skip", default="", metavar="STAGES",
+                       help=f"Comma-separated stages to skip: {', '.join(BENCHMARK_STAGES)}")
+    bench.add_argument("--benchmark-workers", default=",".join(map(str, BENCHMARK_WORKERS)), metavar="COUNTS",
+                       help=f"--workers values the run_batch stage compares, on {BENCHMARK_BATCH_FILES} copies of "
+                            f"each CSV (default {','.join(map(str, BENCHMARK_WORKERS))})")
+    return parser
+
+def main(argv=None):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    args.formats = tuple(dict.fromkeys(args.formats or ["xlsx"]))
+    if args.out_of_core and args.state:
+        parser.error("--out-of-core cannot be combined with --state")
+    if args.async_pipeline and (args.state or args.out_of_core):
+        parser.error("--async-pipeline cannot be combined with --state or --out-of-core")
+    if args.queue_size < 1:
+        parser.error("--queue-size must be at least 1")
+    if args.trend_history and not args.trends:
+        args.trends = TREND_WINDOW
+    if args.trends and args.trends < 2:
+        parser.error("--trends needs a window of at least 2 samples")
+    if args.trend_history and args.workers > 1 and not args.async_pipeline:
+        parser.error("--trend-history folds files in order and needs --workers 1 (or --async-pipeline)")
+    if not 1 <= args.shard_rows <= EXCEL_MAX_ROWS - 2:
+        parser.error(f"--shard-rows must be between 1 and {EXCEL_MAX_ROWS - 2}")
+    if args.startup_benchmark:
+        print(json.dumps(startup_benchmark(args.startup_benchmark), indent=2))
+        return
+    if args.benchmark:
+        sizes = [int(n) for n in args.benchmark.split(",") if n.strip()]
+        run_benchmarks(sizes, args.benchmark_chemicals, args.benchmark_noncompliance, args.benchmark_seed,
+                       skip={s.strip() for s in args.benchmark_skip.split(",") if s.strip()},
+                       out_path=args.benchmark_out,
+                       workers=[int(n) for n in args.benchmark_workers.split(",") if n.strip()])
+        print(f"Benchmark results saved at: {args.benchmark_out}")
+        return
+    if args.serve:
+        serve(args.serve, args.ranges, args.chart)
+        return
+    if args.submit:
+        submit_to_service(args.submit, collect_csv_paths(args.inputs), args.submit_reports,
+                          make_user_info(args.first_name, args.middle_name, args.last_name, args.company, args.date))
+        return
+    if args.output_dir or args.consolidate:
+        if not (args.first_name and args.last_name and args.company):
+            parser.error("--first-name, --last-name and --company are required with --output-dir or --consolidate")
+        if args.date:
+            try:
+                datetime.strptime(args.date, "%Y%m%d")
+            except ValueError:
+                parser.error("--date must be YYYYMMDD")
 
-# -------------------- Main --------------------
-import sys
-import tkinter as tk
-from tkinter import filedialog, Tk
-def main():   
+    report = RunReport() if args.run_report else None
+    try:
+        with profiling(args.profile, args.profile_dir), instrumented(report):
+            if args.consolidate:
+                artifact_paths = collect_rollup_paths(args.inputs)
+                if not artifact_paths:
+                    print("No rollup summaries found. Exiting.")
+                    return
+                user_info = make_user_info(args.first_name, args.middle_name, args.last_name, args.company, args.date)
+                summary = consolidate_summaries(artifact_paths, args.consolidate, user_info, report_options(args))
+                if report is not None:
+                    report.info.update(inputs=artifact_paths, output=args.consolidate, rows=summary.rows)
+            elif args.output_dir:
+                run_headless(args, report)
+            else:
+                run_interactive(args, report)
+    finally:
+        if report is not None:
+            report.save(args.run_report)
+            print(f"Run report saved at: {args.run_report}")
+
+def run_interactive(args, report=None):
+    """Single-file mode: drag-and-drop or file picker, then the details and save dialogs."""
     # Step 1: Get file path from drag-and-drop or file picker
-    if len(sys.argv) > 1:
+    if args.inputs:
         # Drag-and-drop case
-        csv_path = sys.argv[1]
+        csv_path = args.inputs[0]
         if not os.path.isfile(csv_path):
             print("The dropped file is not valid.")
             sys.exit(1)
     else:
         # No drag-and-drop → open file picker
-        root = tk.Tk()
-        root.withdraw()  # hide main Tkinter window
-        csv_path = filedialog.askopenfilename(
-            title="Select CSV file",
-            filetypes=[("CSV Files", "*.csv")]
-        )
+        csv_path = select_file(title="Select CSV file")
         if not csv_path:
             print("No file selected. Exiting.")
             sys.exit(0)
 
     print(f"Processing file: {csv_path}")
 
-    df = pd.read_csv(csv_path)
     user_info = get_user_info()
     save_path = get_save_path(user_info)
     if not save_path:
         print("No save location chosen. Exiting.")
         return
 
-    df = standardize_csv_headers(df)
-    ranges_df = load_ranges()
-    df = check_compliance(df, ranges_df)
-    format_excel(df, save_path, user_info)
-    
+    # Stream the CSV so the full frame is never held in memory
+    with stage("load_ranges"):
+        ranges_df = load_ranges(args.ranges)
+    summary = process_csv(csv_path, save_path, user_info, ranges_df, report_options(args), state_path=args.state,
+                          partitions=args.out_of_core, work_dir=args.work_dir)
+    if report is not None:
+        report.info.update(inputs=[csv_path], output=save_path, rows=summary.rows)
+
 
 if __name__ == "__main__":
     main()
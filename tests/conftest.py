@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ComplianceMole as C  # noqa: E402
+
+USER_INFO = C.make_user_info("Ada", "", "Lovelace", "Acme", "20260101")
+
+
+def synthetic_data(rows, chemicals=25, seed=0):
+    """(samples, ranges) frames as read back from C.make_synthetic_data's files."""
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path, ranges_path = C.make_synthetic_data(tmp, rows, chemicals, seed=seed)
+        return pd.read_csv(csv_path), pd.read_excel(ranges_path)
+
+
+def make_ranges(chemicals=25, seed=0) -> pd.DataFrame:
+    """Ranges table as the workbook holds it: one row per chemical (CHEM-0000, ...)."""
+    return synthetic_data(0, chemicals, seed)[1]
+
+
+def make_samples(rows=300, chemicals=25, seed=0) -> pd.DataFrame:
+    """Synthetic samples for make_ranges(chemicals, seed), plus blanks, an unknown chemical and free text."""
+    samples = synthetic_data(rows, chemicals, seed)[0]
+    rng = np.random.default_rng(seed + 1)
+    chemical, measurements = samples.columns[1], samples.columns[2:]
+    samples.loc[rng.random(rows) < 0.04, chemical] = "Mystery"
+    for col in measurements:
+        samples.loc[rng.random(rows) < 0.03, col] = np.nan
+    samples["Notes"] = np.where(rng.random(rows) < 0.2, "recheck", "")
+    return samples
+
+
+@pytest.fixture
+def report_inputs(tmp_path, monkeypatch):
+    """(csv_path, ranges_path) for a small synthetic run; chart images are cached under tmp_path."""
+    monkeypatch.setattr(C, "CHART_CACHE_DIR", str(tmp_path / "charts"))
+    csv_path, ranges_path = tmp_path / "samples.csv", tmp_path / "ranges.xlsx"
+    make_samples().to_csv(csv_path, index=False)
+    make_ranges().to_excel(ranges_path, index=False)
+    return str(csv_path), str(ranges_path)
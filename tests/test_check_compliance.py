@@ -0,0 +1,74 @@
+"""Vectorized check_compliance against the original per-row loop, including its fallbacks."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline_report
+from conftest import C, make_ranges, make_samples
+
+MEASUREMENTS = ["CONCENTRATION", "pH LEVEL", "TEMPERATURE", "PRESSURE", "FLOW RATE"]
+
+
+def assert_same_outcome(actual, expected):
+    # Values only: the vectorized columns may be categorical where the loop's are object
+    assert actual["STATUS"].tolist() == expected["STATUS"].tolist()
+    assert actual["COMMENT"].tolist() == expected["COMMENT"].tolist()
+
+
+def _ranges_with_edge_cases():
+    ranges = make_ranges(chemicals=6).set_index("Chemical")
+    ranges = ranges.astype(object)
+    ranges.loc["CHEM-0001", "pH_Level_Max"] = np.nan  # NaN limit
+    ranges.loc["CHEM-0002", "Temperature_C_Min"] = "n/a"  # non-numeric limit
+    ranges.loc["CHEM-0003", "Pressure_kPa_Max"] = "250"  # number stored as text
+    dup = ranges.loc[["CHEM-0004"]].copy()
+    dup["Concentration_ppm_Max"] = 1.0
+    return pd.concat([ranges, dup])  # CHEM-0004 listed twice
+
+
+def _samples(chemicals):
+    rows = []
+    for chem in chemicals:
+        rows.append([chem, 10.0, 7.0, 20.0, 150.0, 5.0])  # mostly in range
+        rows.append([chem, np.nan, 7.0, 20.0, 150.0, 5.0])  # NaN value
+        rows.append([chem, 1e6, -1.0, 500.0, 0.0, 100.0])  # everything out of range
+    df = pd.DataFrame(rows, columns=["CHEMICAL"] + MEASUREMENTS)
+    df.insert(0, "SAMPLE ID", [f"S{i}" for i in range(len(df))])
+    return df
+
+
+@pytest.mark.parametrize("chemical",
+                         ["CHEM-0000", "CHEM-0001", "CHEM-0002", "CHEM-0003", "CHEM-0004", "Mystery", np.nan],
+                         ids=["plain", "nan_limit", "text_limit", "number_as_text", "duplicated", "unknown",
+                              "nan_chemical"])
+def test_matches_per_row_loop(chemical):
+    ranges = _ranges_with_edge_cases()
+    df = _samples([chemical])
+    expected = baseline_report.check_compliance(df.copy(), ranges)
+    actual = C.check_compliance(df.copy(), ranges)
+    assert_same_outcome(actual, expected)
+
+
+def test_non_numeric_reading_matches_per_row_loop():
+    ranges = _ranges_with_edge_cases()
+    df = _samples(["CHEM-0000", "CHEM-0002"]).astype({"PRESSURE": object})
+    df.loc[0, "PRESSURE"] = "high"
+    expected = baseline_report.check_compliance(df.copy(), ranges)
+    actual = C.check_compliance(df.copy(), ranges)
+    assert_same_outcome(actual, expected)
+
+
+def test_missing_required_column_matches_per_row_loop():
+    ranges = _ranges_with_edge_cases()
+    df = _samples(["CHEM-0000"]).drop(columns="FLOW RATE")
+    expected = baseline_report.check_compliance(df.copy(), ranges)
+    actual = C.check_compliance(df.copy(), ranges)
+    assert_same_outcome(actual, expected)
+
+
+def test_synthetic_run_matches_per_row_loop():
+    ranges = make_ranges()
+    df = C.standardize_csv_headers(make_samples(rows=500))
+    expected = baseline_report.check_compliance(df.copy(), ranges.set_index("Chemical"))
+    actual = C.check_compliance(df.copy(), ranges.set_index("Chemical"))
+    assert_same_outcome(actual, expected)
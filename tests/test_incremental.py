@@ -0,0 +1,30 @@
+"""Incremental (--state) runs report the same rows as a full run."""
+import pandas as pd
+import pytest
+
+from conftest import USER_INFO, C, make_ranges, make_samples
+
+
+@pytest.fixture
+def no_flow_rate(tmp_path):
+    """Samples without a flow rate column, and their ranges."""
+    samples = make_samples()
+    csv_path, ranges_path = tmp_path / "samples.csv", tmp_path / "ranges.xlsx"
+    samples.drop(columns=samples.columns[6]).to_csv(csv_path, index=False)
+    make_ranges().to_excel(ranges_path, index=False)
+    return str(csv_path), C.load_ranges(str(ranges_path), use_cache=False)
+
+
+def _rows(csv_path, save_path, ranges_df, **kwargs):
+    C.process_csv(csv_path, save_path, USER_INFO, ranges_df, C.ReportOptions(formats=("csv",)), **kwargs)
+    return pd.read_csv(C.output_paths(save_path, ("csv",))["csv"][0])
+
+
+def test_missing_column_checks_as_blank(no_flow_rate, tmp_path):
+    csv_path, ranges_df = no_flow_rate
+    full = _rows(csv_path, str(tmp_path / "full.xlsx"), ranges_df)
+    assert full["FLOW RATE"].isna().all()
+    state_path = str(tmp_path / "state.sqlite")
+    for run in ("first", "rerun"):
+        rows = _rows(csv_path, str(tmp_path / f"{run}.xlsx"), ranges_df, state_path=state_path)
+        pd.testing.assert_frame_equal(rows, full, obj=run)
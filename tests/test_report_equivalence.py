@@ -0,0 +1,140 @@
+"""The single-pass report matches the original save/reload/restyle one, cell for cell.
+
+Only the Summary score changes on purpose: D7 and the TOTAL row's score cell hold the
+precomputed value instead of the original per-chemical SUM formula.
+"""
+import math
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import baseline_report
+from conftest import USER_INFO, C
+
+
+def _side(side):
+    if side is None or side.style is None:
+        return None
+    return side.style, side.color.rgb if side.color else None
+
+
+def _style(cell):
+    font, fill, align, border = cell.font, cell.fill, cell.alignment, cell.border
+    return (
+        cell.number_format,
+        (font.name, font.b, font.i, font.sz, font.color.rgb if font.color else None),
+        (fill.fill_type, fill.fgColor.rgb),
+        (align.horizontal, align.vertical, align.indent, align.wrap_text),
+        tuple(_side(getattr(border, edge)) for edge in ("left", "right", "top", "bottom")),
+    )
+
+
+def _same_value(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        # Means aggregated chunk by chunk may differ in the last digit
+        return (math.isnan(a) and math.isnan(b)) or math.isclose(a, b, rel_tol=1e-12)
+    return a == b
+
+
+def _score_row(ws):
+    return next(row for row in range(11, ws.max_row + 1) if ws[f"B{row}"].value == "TOTAL:")
+
+
+def _expected_score(ws):
+    """Value of the original =SUM(I11*(C11/100)+...) score formula."""
+    return sum(ws[f"I{row}"].value * (ws[f"C{row}"].value / 100) for row in range(11, _score_row(ws)))
+
+
+def assert_same_workbook(expected_path, actual_path):
+    expected, actual = openpyxl.load_workbook(expected_path), openpyxl.load_workbook(actual_path)
+    assert actual.sheetnames == expected.sheetnames
+    assert actual.active.title == expected.active.title
+    for exp in expected:
+        act = actual[exp.title]
+        assert sorted(map(str, act.merged_cells.ranges)) == sorted(map(str, exp.merged_cells.ranges)), exp.title
+        assert ({k: d.width for k, d in act.column_dimensions.items() if d.width}
+                == {k: d.width for k, d in exp.column_dimensions.items() if d.width}), exp.title
+        assert act.auto_filter.ref == exp.auto_filter.ref, exp.title
+        assert (act.max_row, act.max_column) == (exp.max_row, exp.max_column), exp.title
+        assert ({k: d.height for k, d in act.row_dimensions.items() if d.height}
+                == {k: d.height for k, d in exp.row_dimensions.items() if d.height}), exp.title
+        assert len(act._images) == len(exp._images), exp.title
+
+        score_cells = {"D7", f"I{_score_row(exp)}"} if exp.title == "Summary" else set()
+        for row in exp.iter_rows():
+            for cell in row:
+                other = act[cell.coordinate]
+                where = f"{exp.title}!{cell.coordinate}"
+                assert _style(other) == _style(cell), where
+                if cell.coordinate in score_cells:
+                    assert other.value == pytest.approx(_expected_score(exp), rel=1e-12), where
+                else:
+                    assert _same_value(other.value, cell.value), (where, cell.value, other.value)
+
+
+@pytest.fixture
+def baseline_workbook(report_inputs, tmp_path):
+    csv_path, ranges_path = report_inputs
+    df = baseline_report.standardize_csv_headers(pd.read_csv(csv_path))
+    df = baseline_report.check_compliance(df, baseline_report.load_ranges(ranges_path))
+    path = str(tmp_path / "baseline.xlsx")
+    baseline_report.format_excel(df, path, USER_INFO)
+    return path
+
+
+@pytest.mark.parametrize("write_only", [True, False], ids=["write_only", "in_memory"])
+def test_process_csv_matches_original_report(report_inputs, baseline_workbook, tmp_path, write_only):
+    csv_path, ranges_path = report_inputs
+    path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, path, USER_INFO, C.load_ranges(ranges_path, use_cache=False),
+                  C.ReportOptions(write_only=write_only))
+    assert_same_workbook(baseline_workbook, path)
+
+
+def test_format_excel_frame_matches_original_report(report_inputs, baseline_workbook, tmp_path):
+    csv_path, ranges_path = report_inputs
+    df = C.check_compliance(C.standardize_csv_headers(pd.read_csv(csv_path)), C.load_ranges(ranges_path, use_cache=False))
+    path = str(tmp_path / "report.xlsx")
+    C.format_excel(df, path, USER_INFO, C.ReportOptions(write_only=False))
+    assert_same_workbook(baseline_workbook, path)
+
+
+def test_in_memory_chunks_match_original_report(report_inputs, baseline_workbook, tmp_path):
+    csv_path, ranges_path = report_inputs
+    path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, path, USER_INFO, C.load_ranges(ranges_path, use_cache=False),
+                  C.ReportOptions(chunksize=37, write_only=False))
+    assert_same_workbook(baseline_workbook, path)
+
+
+def test_score_formula_is_one_sumproduct(report_inputs, baseline_workbook, tmp_path):
+    csv_path, ranges_path = report_inputs
+    path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, path, USER_INFO, C.load_ranges(ranges_path, use_cache=False),
+                  C.ReportOptions(score_formula=True))
+    ws = openpyxl.load_workbook(path)["Summary"]
+    row = _score_row(ws)
+    assert ws[f"I{row}"].value == f"=SUMPRODUCT(I11:I{row - 1},C11:C{row - 1})/100"
+    assert ws["D7"].value == f"=I{row}"
+
+
+@pytest.mark.parametrize("write_only", [True, False], ids=["write_only", "in_memory"])
+@pytest.mark.parametrize("fast_path", [True, False], ids=["openpyxl_internals", "public_api"])
+def test_openpyxl_fast_path_and_public_api_match_original(report_inputs, baseline_workbook, tmp_path, monkeypatch, write_only,
+                                                        fast_path):
+    if fast_path and not C.OPENPYXL_FAST_PATH:
+        pytest.skip(f"openpyxl {openpyxl.__version__} takes the public API only")
+    monkeypatch.setattr(C, "OPENPYXL_FAST_PATH", fast_path)
+    csv_path, ranges_path = report_inputs
+    path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, path, USER_INFO, C.load_ranges(ranges_path, use_cache=False),
+                  C.ReportOptions(write_only=write_only))
+    assert_same_workbook(baseline_workbook, path)
+
+
+def test_default_options_match_original_report(report_inputs, baseline_workbook, tmp_path):
+    csv_path, ranges_path = report_inputs
+    path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, path, USER_INFO, C.load_ranges(ranges_path, use_cache=False))
+    assert_same_workbook(baseline_workbook, path)
@@ -0,0 +1,52 @@
+"""Result files next to the report: column types that drift between chunks, and their names."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import USER_INFO, C, make_ranges, make_samples
+
+
+@pytest.fixture
+def drifting_csv(tmp_path):
+    """SAMPLE IDs numeric and Notes blank for the first 60 rows, text after."""
+    samples = make_samples(rows=120)
+    sample_id = samples.columns[0]
+    samples[sample_id] = [str(i) for i in range(60)] + [f"S-{i}" for i in range(60, 120)]
+    samples["Notes"] = [""] * 60 + ["recheck" if i % 3 else "" for i in range(60, 120)]
+    path = tmp_path / "drift.csv"
+    samples.to_csv(path, index=False)
+    return str(path), samples.rename(columns={sample_id: "SAMPLE ID"})
+
+
+def test_parquet_rows_survive_type_drift(drifting_csv, tmp_path):
+    pytest.importorskip("pyarrow")
+    csv_path, samples = drifting_csv
+    ranges_path = tmp_path / "ranges.xlsx"
+    make_ranges().to_excel(ranges_path, index=False)
+    save_path = str(tmp_path / "report.xlsx")
+    C.process_csv(csv_path, save_path, USER_INFO, C.load_ranges(str(ranges_path), use_cache=False),
+                  C.ReportOptions(chunksize=50, formats=("csv", "parquet")))
+    paths = C.output_paths(save_path, ("csv", "parquet"))
+
+    rows = pd.read_parquet(paths["parquet"][0])
+    assert rows["SAMPLE ID"].tolist() == samples["SAMPLE ID"].tolist()
+    assert rows["Notes"].fillna("").tolist() == samples["Notes"].tolist()
+    from_csv = pd.read_csv(paths["csv"][0])
+    for col in C.MEASUREMENT_COLS:
+        np.testing.assert_array_equal(rows[col].to_numpy(), from_csv[col].to_numpy(), err_msg=col)
+
+    stats = pd.read_parquet(paths["parquet"][1])
+    assert pd.api.types.is_integer_dtype(stats["TOTAL"].dtype)
+
+
+def test_rerun_skips_generated_csvs(drifting_csv, tmp_path):
+    csv_path, _ = drifting_csv
+    save_path = C.next_save_path(str(tmp_path), USER_INFO, formats=("csv",))
+    paths = C.output_paths(save_path, ("csv",), trends=True)["csv"]
+    assert len(set(paths)) == 3 and os.path.splitext(save_path)[0] + ".csv" not in paths
+    for path in paths:
+        open(path, "w").close()
+    assert C.collect_csv_paths([str(tmp_path)]) == [csv_path]
+    assert C.collect_csv_paths([paths[0]]) == [paths[0]]
@@ -0,0 +1,97 @@
+"""Scoped, versioned limit rules: indexed resolution against a brute-force scan of every rule."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import C, make_ranges, make_samples
+
+UNDATED = pd.Timestamp("2150-01-01")  # undated samples take the rule in effect last
+
+
+def _scoped_ranges():
+    """Every chemical v1 chemical-wide, plus dated, site and line variants for the first six."""
+    base = make_ranges(chemicals=10)
+    rows = [dict(r, Version=1) for r in base.to_dict("records")]
+    for r, general in zip(base.to_dict("records")[:6], rows):
+        general["Effective_To"] = "2025-06-30"
+        rows.append(dict(r, Concentration_ppm_Max=r["Concentration_ppm_Max"] * 0.7, Effective_From="2025-07-01",
+                         Version=2))
+        rows.append(dict(r, Site="A", Concentration_ppm_Min=0, Concentration_ppm_Max=1000, Version=3))
+        rows.append(dict(r, Site="A", Line="L1", pH_Level_Min=0, pH_Level_Max=14, Effective_From="2025-01-01",
+                         Effective_To="2025-12-31", Version=4))
+        rows.append(dict(r, Line="L2", Temperature_C_Max=30))  # no Version: read_excel types the column float
+    # Overlapping pair: ambiguous, the later start wins
+    r7 = base.to_dict("records")[7]
+    rows.append(dict(r7, Site="B", Effective_From="2025-01-01", Effective_To="2025-08-01", Version=6))
+    rows.append(dict(r7, Site="B", Effective_From="2025-06-01", Version=7))
+    return pd.DataFrame(rows)
+
+
+def _brute_force(rules: pd.DataFrame, samples: pd.DataFrame) -> np.ndarray:
+    def day(value, default):
+        return default if value is None or pd.isna(value) else pd.Timestamp(value)
+
+    def text(value):
+        return value if isinstance(value, str) else ""
+
+    want = []
+    for chem, site, line, date in zip(samples["CHEMICAL"], samples["SITE"], samples["LINE"], samples["SAMPLE DATE"]):
+        when = day(date, UNDATED)
+        found = -1
+        for use_site, use_line in ((True, True), (True, False), (False, True), (False, False)):
+            candidates = [
+                i for i, r in rules.iterrows()
+                if r.Chemical == chem
+                and text(r.get("Site")) == (text(site) if use_site else "")
+                and text(r.get("Line")) == (text(line) if use_line else "")
+                and day(r.get("Effective_From"), pd.Timestamp("1900-01-01")) <= when
+                < day(r.get("Effective_To"), pd.Timestamp("2199-01-01")) + pd.Timedelta(days=1)]
+            if candidates:
+                found = max(candidates, key=lambda i: (day(rules.at[i, "Effective_From"], pd.Timestamp("1900-01-01")), i))
+                break
+        want.append(found)
+    return np.array(want)
+
+
+@pytest.fixture
+def scoped(tmp_path):
+    rules = _scoped_ranges()
+    path = tmp_path / "scoped.xlsx"
+    rules.to_excel(path, index=False)
+    ranges_df = C.load_ranges(str(path), use_cache=False)
+
+    rng = np.random.default_rng(2)
+    samples = make_samples(rows=600, chemicals=10)
+    samples["Plant"] = rng.choice(np.array(["A", "B", "C", None], dtype=object), len(samples))
+    samples["Process Line"] = rng.choice(np.array(["L1", "L2", None], dtype=object), len(samples))
+    dates = (pd.Timestamp("2024-10-01") + pd.to_timedelta(rng.integers(0, 500, len(samples)), unit="D"))
+    samples["Sample Date"] = np.where(rng.random(len(samples)) < 0.1, None, dates.strftime("%Y-%m-%d"))
+    return rules, ranges_df, samples
+
+
+def test_limit_codes_match_brute_force(scoped):
+    rules, ranges_df, samples = scoped
+    limits = C.range_limits(ranges_df)
+    df = C.standardize_csv_headers(samples, C.is_scoped(ranges_df))
+    codes = C.limit_codes(df, limits)
+    np.testing.assert_array_equal(codes, _brute_force(rules, df))
+    assert (codes >= 0).any() and (codes < 0).any()
+
+
+def test_rule_labels_print_whole_versions(scoped):
+    _, ranges_df, samples = scoped
+    limits = C.range_limits(ranges_df)
+    df = C.standardize_csv_headers(samples, True)
+    labels = set(C.rule_labels(C.limit_codes(df, limits), limits))
+    assert ranges_df["Version"].dtype == float
+    assert {"CHEM-0000 @ A/* v3", "CHEM-0000 @ */L2"} <= labels
+    assert not any(label.endswith(".0") for label in labels)
+
+
+def test_scope_headers_only_matched_for_scoped_ranges():
+    columns = ["id", "chemical", "Date", "Line", "Facility", "notes"]
+    plain = C.standardize_csv_headers(pd.DataFrame(columns=columns)).columns
+    assert {"Date", "Line", "Facility"} <= set(plain)
+    assert not {"SAMPLE DATE", "LINE", "SITE"} & set(plain)
+    scoped = C.standardize_csv_headers(pd.DataFrame(columns=columns), scoped=True).columns
+    assert {"SAMPLE DATE", "LINE", "SITE"} <= set(scoped)